@@ -0,0 +1,117 @@
+"""
+Structured, non-blocking logging for the API.
+
+Records are filtered (level, debug sampling) and stamped with the request's
+correlation id in the calling thread, then handed to a queue; formatting
+and the actual write happen on a listener thread, so logging never blocks
+the event loop on stdout.
+
+Environment:
+    LOG_LEVEL               DEBUG, INFO (default), WARNING, ...
+    LOG_FORMAT              json (default) or text
+    LOG_DEBUG_SAMPLE_RATE   Fraction of DEBUG records kept (default 1.0)
+"""
+import os
+import sys
+import json
+import queue
+import random
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+# Correlation id of the request being handled, set by RequestContextMiddleware
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed via extra= and is logged as a field
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+class RequestContextFilter(logging.Filter):
+    """Stamps records with the current request id (must run in the logging thread)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+class DebugSamplingFilter(logging.Filter):
+    """Keeps only a fraction of DEBUG records; other levels always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or self.rate >= 1.0 or random.random() < self.rate
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message, request_id and extra fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Human-readable variant for local development."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = " ".join(f"{key}={value!r}" for key, value in record.__dict__.items() if key not in _RESERVED_ATTRS)
+        request_id = getattr(record, "request_id", None)
+        line = f"{self.formatTime(record)} {record.levelname:<7} {record.name} "
+        line += f"[{request_id}] " if request_id else ""
+        line += record.getMessage() + (f" {fields}" if fields else "")
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    # The listener is in the same process, so skip the default eager formatting
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def configure_logging():
+    """Install the queue-based handler on the root logger (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    formatter = TextFormatter() if os.getenv("LOG_FORMAT", "json").lower() == "text" else JsonFormatter()
+    sample_rate = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(DebugSamplingFilter(sample_rate))
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.handlers = [queue_handler]
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
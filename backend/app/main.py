@@ -1,12 +1,36 @@
 import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# Once, before anything reads the environment (services read it lazily)
+load_dotenv()
+
 from fastapi import FastAPI
+from app.logging_config import configure_logging, shutdown_logging
+
+configure_logging()
+
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import auth, scan, wardrobe, chat
+from fastapi.responses import PlainTextResponse, ORJSONResponse
+from app.middleware import MetricsMiddleware, RequestContextMiddleware, CompressionMiddleware, AdmissionMiddleware, RateLimitMiddleware
+from app.routers import auth, scan, wardrobe, chat, admin
+from app.services.storage_reclaimer import storage_reclaimer
+from app.services.import_service import import_service
+from app.services.metrics_service import metrics_service
+from app.services.usage_service import usage_service
+from app.services.warmup_service import warmup_service
+from app.services.supabase_service import supabase_service
+from app.services.wardrobe_replica import wardrobe_replica
+from app.services.scan_prefetch import scan_prefetch_service
+from app.services.admission_service import admission_service
 
 app = FastAPI(
     title="StyleIt API",
     description="Backend API for the StyleIt wardrobe tracker application",
-    version="1.0.0"
+    version="1.0.0",
+    # orjson instead of stdlib json for every JSON response
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS - supports both local development and production
@@ -23,19 +47,64 @@ if frontend_url:
     if "vercel.app" in frontend_url:
         allowed_origins.append("https://*.vercel.app")
 
+# Per-class concurrency pools with fast 503s (innermost, so CORS headers reach the 503s too)
+app.add_middleware(AdmissionMiddleware)
+
+# Per-user token buckets: RateLimit-* headers, 429 when a user's bucket is empty. Outside
+# admission control, so known users with an empty bucket are refused before taking a slot;
+# a user's first request is charged by the route after auth, inside its slot.
+app.add_middleware(RateLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Request-ID", "Retry-After",
+                    "RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset"],
 )
 
+# brotli/gzip for JSON and text bodies above COMPRESSION_MIN_SIZE
+app.add_middleware(CompressionMiddleware)
+
+# Per-route latency histograms (times everything inside it)
+app.add_middleware(MetricsMiddleware)
+
+# Correlation id for logs (outermost, so every log line carries it)
+app.add_middleware(RequestContextMiddleware)
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(scan.router)
 app.include_router(wardrobe.router)
 app.include_router(chat.router)
+app.include_router(admin.router)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    # Blocking upstream calls run in threads; size the pool so admitted model calls and
+    # background import scans cannot use up the threads reads need
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=admission_service.thread_budget(reserved=import_service.scan_concurrency))
+    )
+    storage_reclaimer.start()
+    scan_prefetch_service.start()
+    usage_service.start()
+    wardrobe_replica.start(supabase_service.sync_wardrobe_replica)
+    # Runs in the background; /health answers immediately
+    warmup_service.start()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await warmup_service.stop()
+    # Before the reclaimer, which flushes the unclaimed uploads this hands it
+    await scan_prefetch_service.stop()
+    await storage_reclaimer.stop()
+    await usage_service.stop()
+    await wardrobe_replica.stop()
+    import_service.shutdown()
+    shutdown_logging()
 
 @app.get("/")
 async def root():
@@ -48,4 +117,9 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {"status": "healthy", "warmup": warmup_service.status, "admission": admission_service.status()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Latency histograms in Prometheus text format."""
+    return PlainTextResponse(metrics_service.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,257 @@
+import os
+import re
+import gzip
+import time
+import uuid
+import brotli
+import orjson
+from typing import Optional
+from starlette.types import ASGIApp, Receive, Scope, Send, Message
+from app.logging_config import request_id_var
+from app.services.metrics_service import metrics_service
+from app.services.admission_service import admission_service, AdmissionRejected
+from app.services.rate_limiter import rate_limiter, rate_limit_context, RateLimitContext, RateLimitExceeded
+
+class RequestContextMiddleware:
+    """
+    Assigns each request a correlation id (client-supplied X-Request-ID if it
+    looks sane, otherwise a new one), exposes it to logging and echoes it back.
+    """
+
+    HEADER = b"x-request-id"
+    _VALID_ID = re.compile(rb"^[A-Za-z0-9._-]{1,64}$")
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        supplied = dict(scope["headers"]).get(self.HEADER, b"")
+        request_id = supplied.decode() if self._VALID_ID.match(supplied) else uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(self.HEADER, request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
+
+class MetricsMiddleware:
+    """Records per-route request latency into metrics_service."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Label by route template, not raw path, to keep series bounded
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            metrics_service.http_requests.observe(
+                time.perf_counter() - start, scope["method"], route_path, str(status)
+            )
+
+class AdmissionMiddleware:
+    """
+    Runs each HTTP request in its endpoint class's admission pool (see
+    AdmissionService) and answers 503 with Retry-After, without touching the
+    route, when the pool is saturated.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        pool = admission_service.classify(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if pool is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            async with admission_service.slot(pool):
+                await self.app(scope, receive, send)
+        except AdmissionRejected as e:
+            body = orjson.dumps({"detail": f"Server busy ({e.pool}), retry later"})
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(e.retry_after).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+
+class RateLimitMiddleware:
+    """
+    Sets the cost of each HTTP request for RateLimiter.enforce (called by the
+    routes once the user is known), adds the RateLimit-* headers it produced,
+    and turns RateLimitExceeded into 429 with Retry-After. Wraps admission
+    control, so a known user with an empty bucket is refused before taking
+    a slot (RateLimiter.precheck).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not rate_limiter.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        authorization = dict(scope["headers"]).get(b"authorization", b"").decode("latin-1")
+        context = RateLimitContext(
+            cost=rate_limiter.cost(scope["method"], scope["path"]),
+            token=authorization.replace("Bearer ", "") or None,
+        )
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start" and context.result is not None:
+                message["headers"] = list(message.get("headers", [])) + [
+                    (name.lower().encode(), value.encode()) for name, value in rate_limiter.headers(context.result).items()
+                ]
+            await send(message)
+
+        async def too_many_requests():
+            body = orjson.dumps({"detail": "Too many requests, retry later"})
+            await send_wrapper({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            })
+            await send_wrapper({"type": "http.response.body", "body": body})
+
+        # A known user with an empty bucket is refused before admission control and auth
+        context.result = rate_limiter.precheck(context)
+        if context.result is not None:
+            await too_many_requests()
+            return
+
+        token = rate_limit_context.set(context)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except RateLimitExceeded:
+            await too_many_requests()
+        finally:
+            rate_limit_context.reset(token)
+
+class CompressionMiddleware:
+    """
+    Compresses complete (non-streaming) text and JSON responses with brotli
+    or gzip, whichever the client prefers (brotli on a tie).
+
+    Responses smaller than COMPRESSION_MIN_SIZE bytes, already encoded, or
+    streamed in several chunks (e.g. the wardrobe export) pass through as-is.
+    """
+
+    COMPRESSIBLE_TYPES = (b"application/json", b"text/")
+    BROTLI_QUALITY = 4  # Close to gzip -6 in ratio, at a fraction of brotli's default CPU cost
+    GZIP_LEVEL = 6
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.min_size = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+    @staticmethod
+    def _choose_encoding(accept_encoding: str) -> Optional[str]:
+        weights = {}
+        for part in accept_encoding.split(","):
+            coding, _, params = part.strip().partition(";")
+            quality = 1.0
+            params = params.strip()
+            if params.startswith("q="):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            weights[coding.strip().lower()] = quality
+        best = max(("br", "gzip"), key=lambda coding: weights.get(coding, weights.get("*", 0.0)))
+        return best if weights.get(best, weights.get("*", 0.0)) > 0 else None
+
+    def _compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.BROTLI_QUALITY)
+        return gzip.compress(body, compresslevel=self.GZIP_LEVEL, mtime=0)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = dict(scope["headers"]).get(b"accept-encoding", b"").decode("latin-1")
+        encoding = self._choose_encoding(accept_encoding) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        passthrough = False
+
+        async def send_wrapper(message: Message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = {name.lower(): value for name, value in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"")
+                if b"content-encoding" in headers or not content_type.startswith(self.COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Held back until the body shows whether it is worth compressing
+                    start_message = message
+                return
+
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = list(start_message.get("headers", []))
+            vary = [value for name, value in headers if name.lower() == b"vary"]
+            headers = [(name, value) for name, value in headers if name.lower() != b"vary"]
+            headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+
+            if message.get("more_body", False) or len(body) < self.min_size:
+                # Streamed, or too small to be worth it
+                passthrough = True
+                start_message["headers"] = headers
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = self._compress(body, encoding)
+            start_message["headers"] = [(name, value) for name, value in headers if name.lower() != b"content-length"] + [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(compressed)).encode()),
+            ]
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
@@ -6,12 +6,14 @@ from datetime import datetime
 ColorType = Literal["Black", "White", "Gray", "Blue", "Brown", "Green", "Red", "Pink", "Yellow", "Purple", "Orange"]
 WarmthType = Literal["Cold", "Cool", "Neutral", "Warm", "Hot"]
 
-class WardrobeItemCreate(BaseModel):
+class WardrobeItemMetadata(BaseModel):
     title: str = Field(..., min_length=1, max_length=100)
     description: str = Field(..., min_length=1, max_length=500)
     color: ColorType
     warmth: WarmthType
     formality: int = Field(..., ge=1, le=10)
+
+class WardrobeItemCreate(WardrobeItemMetadata):
     image_url: str
 
 class WardrobeItemUpdate(BaseModel):
@@ -26,6 +28,48 @@ class WardrobeItem(WardrobeItemCreate):
     user_id: str
     created_at: datetime
 
+class WardrobeChanges(BaseModel):
+    version: int  # Pass as since= on the next sync
+    reset: bool = False  # True if the client must replace its copy with upserted
+    upserted: list[WardrobeItem] = []
+    deleted: list[str] = []
+
+# Bulk Models
+BULK_MAX_ITEMS = 100
+
+class BulkUpdateRequest(BaseModel):
+    item_ids: list[str] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+    update: WardrobeItemUpdate
+
+class BulkDeleteRequest(BaseModel):
+    item_ids: list[str] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+
+class BulkDeleteResponse(BaseModel):
+    message: str
+    deleted_ids: list[str]
+
+class OutfitSuggestion(BaseModel):
+    top: WardrobeItem
+    bottom: WardrobeItem
+    outer: Optional[WardrobeItem] = None
+    score: float
+
+# Import Models
+class ImportItemError(BaseModel):
+    filename: Optional[str] = None
+    error: str
+
+class ImportJobStatus(BaseModel):
+    job_id: str
+    status: Literal["running", "completed", "limit_reached", "rate_limited", "failed"]
+    total: int
+    processed: int
+    created: int
+    duplicates: int
+    failed: int
+    item_ids: list[str] = []
+    errors: list[ImportItemError] = []
+
 # Scan Models
 class ScanResponse(BaseModel):
     title: str
@@ -33,6 +77,12 @@ class ScanResponse(BaseModel):
     color: ColorType
     warmth: WarmthType
     formality: int
+    detected_color: Optional[ColorType] = None  # Locally extracted color, for cross-checking
+    scan_token: Optional[str] = None  # Pass to POST /wardrobe/ instead of re-sending the image
+
+class ColorPreviewResponse(BaseModel):
+    color: ColorType
+    confidence: float
 
 # Auth Models
 class UserSignup(BaseModel):
@@ -3,6 +3,8 @@ Centralized system prompts for the AI Stylist application.
 Edit these prompts to modify AI behavior across the application.
 """
 
+from typing import Optional
+
 # Scanner Vision Prompt - Used by GPT-4o Vision to analyze clothing images
 SCANNER_VISION_PROMPT = """You are an expert fashion analyst. Analyze the clothing item in this image and extract the following characteristics:
 
@@ -97,13 +99,19 @@ Remember: You have access to the user's complete wardrobe. Use this information
 
 
 # Function to format wardrobe context for the AI
-def format_wardrobe_context(wardrobe_items: list) -> str:
-    """Format wardrobe items into a readable context string for the AI."""
+def format_wardrobe_context(wardrobe_items: list, focused: bool = False) -> str:
+    """
+    Format wardrobe items into a readable context string for the AI.
+    focused: wardrobe_items is only the part relevant to the request (see OutfitIndex.focused_wardrobe).
+    """
     if not wardrobe_items:
         return "\n\n## USER'S WARDROBE:\nThe user's wardrobe is currently empty. Suggest they add items using the camera icon, or provide general styling advice."
 
     context = "\n\n## USER'S WARDROBE:\n"
-    context += "Here are all the items currently in the user's wardrobe:\n\n"
+    if focused:
+        context += "Here are the items from the user's wardrobe that fit this request (other items were left out):\n\n"
+    else:
+        context += "Here are all the items currently in the user's wardrobe:\n\n"
 
     for item in wardrobe_items:
         context += f"**{item['title']}** (ID: {item['id']})\n"
@@ -113,3 +121,27 @@ def format_wardrobe_context(wardrobe_items: list) -> str:
         context += f"- Formality: {item['formality']}/10\n\n"
 
     return context
+
+
+# Function to format pre-ranked outfit candidates for the AI
+def format_outfit_candidates(outfits: list, occasion: Optional[str] = None) -> str:
+    """
+    Format locally ranked outfits into a context string the AI can start from.
+    occasion: Weather/formality the outfits were ranked for, e.g. "Cold weather, formal occasion"
+    """
+    if not outfits:
+        return ""
+
+    context = "\n\n## PRE-RANKED OUTFIT CANDIDATES:\n"
+    if occasion:
+        context += f"These combinations were ranked for the request ({occasion}). Build your answer from them:\n\n"
+    else:
+        context += "These combinations scored well on color harmony, warmth and formality. Prefer them when they fit the request:\n\n"
+
+    for i, outfit in enumerate(outfits, start=1):
+        pieces = [outfit['top']['title'], outfit['bottom']['title']]
+        if outfit['outer']:
+            pieces.append(outfit['outer']['title'])
+        context += f"{i}. " + " + ".join(f"**{piece}**" for piece in pieces) + "\n"
+
+    return context
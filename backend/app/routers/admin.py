@@ -0,0 +1,30 @@
+import os
+import hmac
+from typing import Literal
+from fastapi import APIRouter, HTTPException, Header, Query
+from app.services.usage_service import usage_service
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+def verify_admin(admin_key: str):
+    """Helper function to check the X-Admin-Key header against ADMIN_API_KEY."""
+    expected = os.getenv("ADMIN_API_KEY")
+    # Admin endpoints are disabled unless a key is configured
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not found")
+    # Bytes, as compare_digest raises TypeError on non-ASCII str (headers decode as latin-1)
+    if not hmac.compare_digest(admin_key.encode(), expected.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin key")
+
+@router.get("/usage")
+async def get_usage(
+    x_admin_key: str = Header(...),
+    group_by: Literal["user", "endpoint", "model"] = Query("user")
+):
+    """
+    OpenAI token usage, latency and estimated cost since this server started,
+    grouped by user, endpoint or model. Historical data is in the openai_usage table.
+    """
+    verify_admin(x_admin_key)
+
+    return usage_service.summary(group_by)
@@ -1,14 +1,18 @@
+import asyncio
+import logging
 from fastapi import APIRouter, HTTPException, Header
 from app.models.schemas import UserSignup, UserLogin, AuthResponse
 from app.services.supabase_service import supabase_service
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
 @router.post("/signup", response_model=AuthResponse)
 async def signup(user: UserSignup):
     """Create a new user account."""
     try:
-        response = supabase_service.sign_up(user.email, user.password)
+        response = await asyncio.to_thread(supabase_service.sign_up, user.email, user.password)
 
         if not response.user:
             raise HTTPException(status_code=400, detail="Failed to create account")
@@ -27,15 +31,14 @@ async def signup(user: UserSignup):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Signup error: {str(e)}")
-        print(f"Error type: {type(e)}")
+        logger.warning("Signup failed", extra={"error": str(e), "error_type": type(e).__name__})
         raise HTTPException(status_code=400, detail=f"Signup failed: {str(e)}")
 
 @router.post("/login", response_model=AuthResponse)
 async def login(user: UserLogin):
     """Sign in an existing user."""
     try:
-        response = supabase_service.sign_in(user.email, user.password)
+        response = await asyncio.to_thread(supabase_service.sign_in, user.email, user.password)
 
         if not response.user:
             raise HTTPException(status_code=401, detail="Invalid credentials")
@@ -50,8 +53,7 @@ async def login(user: UserLogin):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Login error: {str(e)}")
-        print(f"Error type: {type(e)}")
+        logger.warning("Login failed", extra={"error": str(e), "error_type": type(e).__name__})
         raise HTTPException(status_code=401, detail=f"Login failed: {str(e)}")
 
 @router.post("/logout")
@@ -66,7 +68,7 @@ async def get_current_user(authorization: str = Header(...)):
     try:
         # Extract token from "Bearer <token>"
         token = authorization.replace("Bearer ", "")
-        response = supabase_service.get_user(token)
+        response = await asyncio.to_thread(supabase_service.get_user, token)
 
         if not response.user:
             raise HTTPException(status_code=401, detail="Invalid token")
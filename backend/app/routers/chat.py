@@ -1,18 +1,93 @@
-from fastapi import APIRouter, HTTPException, Header
+import json
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Header, WebSocket, WebSocketDisconnect
+from fastapi.websockets import WebSocketState
 from app.models.schemas import ChatRequest, ChatResponse, ChatImageReference
 from app.services.openai_service import openai_service
 from app.services.supabase_service import supabase_service
+from app.services.outfit_index import outfit_index
+from app.services.chat_cache import chat_cache
+from app.services.chat_session import chat_session_service, ChatSession
+from app.services.admission_service import admission_service, AdmissionRejected
+from app.services.rate_limiter import rate_limiter, RateLimitExceeded
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
-def get_user_id(authorization: str) -> str:
+# Number of locally ranked outfits injected into the stylist prompt
+CANDIDATE_OUTFIT_COUNT = 5
+
+async def get_user_id(authorization: str) -> str:
     """Helper function to extract and validate user ID from token."""
     token = authorization.replace("Bearer ", "")
-    user_response = supabase_service.get_user(token)
+    user_response = await asyncio.to_thread(supabase_service.get_user, token)
     if not user_response.user:
         raise HTTPException(status_code=401, detail="Invalid token")
+    # Charges this request's route cost to the user (no-op for the WebSocket handshake)
+    await rate_limiter.enforce(user_response.user.id)
     return user_response.user.id
 
+def stylist_context(user_id: str, message: str, wardrobe_items: list) -> tuple[list, list, Optional[str]]:
+    """
+    Choose what the stylist prompt gets: (wardrobe items, candidate outfits, occasion).
+
+    If the message names the weather or an occasion, the candidates come
+    from the matching bucket of the user's outfit index. The wardrobe is
+    then cut down to those outfits plus shoes and accessories.
+    """
+    warmth, band = outfit_index.parse_request(message)
+    if warmth is None and band is None:
+        return wardrobe_items, outfit_index.candidates(user_id, wardrobe_items, limit=CANDIDATE_OUTFIT_COUNT), None
+
+    outfits = outfit_index.candidates(user_id, wardrobe_items, warmth, band, limit=CANDIDATE_OUTFIT_COUNT)
+    if not outfits:
+        # Nothing to build on (e.g. no tops or bottoms yet); let the model see everything
+        return wardrobe_items, [], None
+
+    parts = []
+    if warmth:
+        parts.append(f"{warmth} weather")
+    if band:
+        formality_min, formality_max = outfit_index.FORMALITY_BANDS[band]
+        parts.append(f"{band} occasion, formality {formality_min}-{formality_max}")
+    return outfit_index.focused_wardrobe(user_id, wardrobe_items, outfits), outfits, ", ".join(parts)
+
+def find_referenced_items(ai_response: str, wardrobe_items: list) -> tuple[list[str], list[ChatImageReference]]:
+    """Extract the item IDs and image references mentioned in a stylist response."""
+    referenced_items = []
+    images = []
+    response_lower = ai_response.lower()
+
+    for item in wardrobe_items:
+        # Check if item title or ID is mentioned in the response
+        if item['title'].lower() in response_lower or item['id'] in ai_response:
+            referenced_items.append(item['id'])
+            # Add image reference
+            images.append(ChatImageReference(
+                item_id=item['id'],
+                title=item['title'],
+                image_url=item['image_url']
+            ))
+
+    return referenced_items, images
+
+def find_new_references(response: str, delta_length: int, wardrobe_items: list,
+                        seen: set[str]) -> list[ChatImageReference]:
+    """
+    Image references completed by the last delta_length characters of a
+    streamed response (same matching as find_referenced_items). Adds them to seen.
+    """
+    images = []
+    for item in wardrobe_items:
+        if item['id'] in seen:
+            continue
+        # A mention completed by the delta ends inside it, so only the tail needs searching
+        window = response[-(delta_length + max(len(item['title']), len(item['id']))):]
+        if item['title'].lower() in window.lower() or item['id'] in window:
+            seen.add(item['id'])
+            images.append(ChatImageReference(item_id=item['id'], title=item['title'], image_url=item['image_url']))
+    return images
+
 @router.post("/", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
@@ -22,33 +97,38 @@ async def chat(
     Send a message to the AI stylist.
     The AI is provided with the user's wardrobe and chat history as context.
     """
-    user_id = get_user_id(authorization)
+    user_id = await get_user_id(authorization)
 
     try:
         # Get user's wardrobe items
-        wardrobe_items = supabase_service.get_wardrobe_items(user_id)
+        wardrobe_items = await asyncio.to_thread(supabase_service.get_wardrobe_items, user_id)
 
-        # Get AI response
-        ai_response = openai_service.chat_with_stylist(
-            user_message=request.message,
-            chat_history=[msg.model_dump() for msg in request.history],
-            wardrobe_items=wardrobe_items
-        )
+        chat_history = [msg.model_dump() for msg in request.history]
+        wardrobe_version = chat_cache.wardrobe_version(wardrobe_items)
+
+        ai_response = chat_cache.get(user_id, wardrobe_version, request.message, chat_history)
+
+        if ai_response is None:
+            # Pre-rank outfits locally so the model starts from good combinations
+            prompt_items, candidate_outfits, occasion = await asyncio.to_thread(
+                stylist_context, user_id, request.message, wardrobe_items
+            )
+
+            # Get AI response (in a thread, so a slow model does not hold up other requests)
+            ai_response = await asyncio.to_thread(
+                openai_service.chat_with_stylist,
+                user_message=request.message,
+                chat_history=chat_history,
+                wardrobe_items=prompt_items,
+                candidate_outfits=candidate_outfits,
+                user_id=user_id,
+                occasion=occasion
+            )
 
-        # Extract any item IDs and titles referenced in the response
-        referenced_items = []
-        images = []
-
-        for item in wardrobe_items:
-            # Check if item title or ID is mentioned in the response
-            if item['title'].lower() in ai_response.lower() or item['id'] in ai_response:
-                referenced_items.append(item['id'])
-                # Add image reference
-                images.append(ChatImageReference(
-                    item_id=item['id'],
-                    title=item['title'],
-                    image_url=item['image_url']
-                ))
+            chat_cache.put(user_id, wardrobe_version, request.message, chat_history, ai_response)
+
+        # Image references are always recomputed against the current wardrobe
+        referenced_items, images = find_referenced_items(ai_response, wardrobe_items)
 
         return ChatResponse(
             message=ai_response,
@@ -58,3 +138,156 @@ async def chat(
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
+
+async def authenticate_websocket(websocket: WebSocket) -> str:
+    """Wait for the {"type": "auth", "token": ...} message and return the user ID."""
+    message = json.loads(await asyncio.wait_for(websocket.receive_text(), chat_session_service.auth_timeout))
+    if not isinstance(message, dict) or message.get("type") != "auth" or not message.get("token"):
+        raise HTTPException(status_code=401, detail="Expected an auth message")
+    return await get_user_id(message["token"])
+
+def close_stream_after(pending: Optional[asyncio.Future], stream):
+    """
+    Close a chat stream once no worker thread is inside it. Closing while a
+    next() is still running raises "generator already executing" and leaves
+    the upstream response open.
+    """
+    if pending is None or pending.done():
+        stream.close()
+        return
+
+    def close(future: asyncio.Future):
+        if not future.cancelled():
+            future.exception()  # Retrieved, so an error from the abandoned read is not reported as unhandled
+        stream.close()
+
+    pending.add_done_callback(close)
+
+async def send_error(websocket: WebSocket, payload: dict) -> bool:
+    """
+    Send an error frame after a failed turn. False if the socket is gone -
+    a client dropping mid-stream also fails the turn, and sending to it again
+    would only raise.
+    """
+    if WebSocketState.DISCONNECTED in (websocket.client_state, websocket.application_state):
+        return False
+    try:
+        await websocket.send_json({"type": "error", **payload})
+    except Exception:
+        return False
+    return True
+
+async def stream_turn(websocket: WebSocket, session: ChatSession, user_message: str):
+    """Answer one message: stream the reply, push images as they are mentioned, then send done."""
+    # Each turn costs the same as a POST /chat/
+    await rate_limiter.check(session.user_id, rate_limiter.cost("POST", "/chat/"))
+    await asyncio.to_thread(session.refresh_wardrobe)
+
+    ai_response = chat_cache.get(session.user_id, session.cache_version, user_message, session.history)
+    pushed: set[str] = set()
+
+    if ai_response is None:
+        # Same model pool as POST /chat/, so open sockets cannot bypass admission control
+        async with admission_service.slot("model"):
+            prompt_items, candidate_outfits, occasion = await asyncio.to_thread(
+                stylist_context, session.user_id, user_message, session.wardrobe_items
+            )
+            stream = openai_service.stream_chat_with_stylist(
+                user_message=user_message,
+                chat_history=session.history,
+                wardrobe_items=prompt_items,
+                candidate_outfits=candidate_outfits,
+                user_id=session.user_id,
+                occasion=occasion
+            )
+            ai_response = ""
+            pending: Optional[asyncio.Future] = None
+            try:
+                while True:
+                    # Each chunk is read off the event loop; the OpenAI stream is blocking.
+                    # Shielded, so a cancelled turn can still tell when the thread is done with the stream.
+                    pending = asyncio.ensure_future(asyncio.to_thread(next, stream, None))
+                    delta = await asyncio.shield(pending)
+                    if delta is None:
+                        break
+                    ai_response += delta
+                    await websocket.send_json({"type": "token", "content": delta})
+                    for image in find_new_references(ai_response, len(delta), session.wardrobe_items, pushed):
+                        await websocket.send_json({"type": "image", **image.model_dump()})
+            finally:
+                # Stops the upstream generation if the client went away or the turn was cancelled
+                close_stream_after(pending, stream)
+
+        chat_cache.put(session.user_id, session.cache_version, user_message, session.history, ai_response)
+    else:
+        await websocket.send_json({"type": "token", "content": ai_response})
+
+    referenced_items, images = find_referenced_items(ai_response, session.wardrobe_items)
+    for image in images:
+        if image.item_id not in pushed:
+            await websocket.send_json({"type": "image", **image.model_dump()})
+
+    await websocket.send_json({"type": "done", "message": ai_response, "referenced_items": referenced_items})
+    session.add_turn(user_message, ai_response)
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Chat with the AI stylist over one long-lived connection.
+
+    The client first sends {"type": "auth", "token": "<access token>"}; the
+    server loads the wardrobe once and answers {"type": "ready"}. After that,
+    each {"type": "message", "content": "..."} is answered with a stream of
+    {"type": "token"} and {"type": "image"} messages and a final
+    {"type": "done", "message": ..., "referenced_items": [...]}. History is
+    kept on the server, so only the new message is sent per turn.
+    {"type": "refresh"} reloads the wardrobe immediately.
+    """
+    await websocket.accept()
+
+    try:
+        user_id = await authenticate_websocket(websocket)
+    except WebSocketDisconnect:
+        return
+    except Exception:
+        await websocket.close(code=1008, reason="Authentication failed")
+        return
+
+    session = chat_session_service.open(user_id)
+    try:
+        await asyncio.to_thread(session.load_wardrobe)
+        await websocket.send_json({"type": "ready", "wardrobe_items": len(session.wardrobe_items)})
+
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except json.JSONDecodeError:
+                await websocket.send_json({"type": "error", "detail": "Messages must be JSON"})
+                continue
+
+            kind = message.get("type") if isinstance(message, dict) else None
+            if kind == "message" and isinstance(message.get("content"), str) and message["content"].strip():
+                try:
+                    await stream_turn(websocket, session, message["content"])
+                except WebSocketDisconnect:
+                    raise
+                except AdmissionRejected as e:
+                    if not await send_error(websocket, {"detail": "The stylist is busy, try again shortly",
+                                                        "retry_after": e.retry_after}):
+                        return
+                except RateLimitExceeded as e:
+                    if not await send_error(websocket, {"detail": "Too many messages, slow down",
+                                                        "retry_after": e.result.retry_after}):
+                        return
+                except Exception as e:
+                    if not await send_error(websocket, {"detail": f"Chat failed: {str(e)}"}):
+                        return
+            elif kind == "refresh":
+                await asyncio.to_thread(session.refresh_wardrobe, True)
+                await websocket.send_json({"type": "ready", "wardrobe_items": len(session.wardrobe_items)})
+            else:
+                await websocket.send_json({"type": "error", "detail": "Expected a message or refresh"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        chat_session_service.close(session)
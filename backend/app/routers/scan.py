@@ -1,11 +1,21 @@
+import asyncio
+import logging
 from fastapi import APIRouter, File, UploadFile, HTTPException, Header
-from app.models.schemas import ScanResponse
+from typing import get_args
+from app.models.schemas import ScanResponse, ColorPreviewResponse, ColorType
 from app.services.openai_service import openai_service
 from app.services.image_service import image_service
 from app.services.supabase_service import supabase_service
+from app.services.scan_prefetch import scan_prefetch_service
+from app.services.rate_limiter import rate_limiter, RateLimitExceeded
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/scan", tags=["scanner"])
 
+# Weight share of the dominant color cluster above which the local estimate overrides a disagreeing model color
+COLOR_OVERRIDE_CONFIDENCE = 0.6
+
 @router.post("/", response_model=ScanResponse)
 async def scan_clothing(
     file: UploadFile = File(...),
@@ -14,13 +24,18 @@ async def scan_clothing(
     """
     Upload a clothing image and extract metadata using GPT-4o Vision.
     Returns the extracted characteristics for preview before saving.
+
+    The stored copy of the image is uploaded while the model runs; pass the
+    returned scan_token to POST /wardrobe/ instead of the file.
     """
+    scan_token = None
     try:
         # Verify user authentication
         token = authorization.replace("Bearer ", "")
-        user_response = supabase_service.get_user(token)
+        user_response = await asyncio.to_thread(supabase_service.get_user, token)
         if not user_response.user:
             raise HTTPException(status_code=401, detail="Invalid token")
+        await rate_limiter.enforce(user_response.user.id)
 
         # Read image data
         image_data = await file.read()
@@ -29,16 +44,35 @@ async def scan_clothing(
         if not image_service.validate_image(image_data):
             raise HTTPException(status_code=400, detail="Invalid image file")
 
-        # Compress image
-        compressed_image = image_service.compress_image(image_data)
+        # One decode yields the vision-model copy now; the stored copy is compressed
+        # and uploaded in the background while the model runs
+        scan_token, vision_image = await scan_prefetch_service.stash(user_response.user.id, image_data)
 
-        # Analyze image with GPT-4o Vision
-        scan_result = openai_service.scan_clothing_image(compressed_image)
+        # Analyze image with GPT-4o Vision, with a local color estimate (from the small copy) to cross-check it.
+        # Both run in threads so the event loop keeps serving other requests meanwhile.
+        scan_result, (detected_color, color_confidence) = await asyncio.gather(
+            asyncio.to_thread(openai_service.scan_clothing_image, vision_image, user_id=user_response.user.id),
+            asyncio.to_thread(image_service.extract_dominant_color, vision_image),
+        )
 
-        print(f"\n=== SCAN RESULT FROM OPENAI ===")
-        print(f"Raw response: {scan_result}")
-        for key, value in scan_result.items():
-            print(f"  {key}: {value!r} (type: {type(value).__name__})")
+        # Fall back to the local estimate when the model returns an unusable color,
+        # and prefer it over a disagreeing model when the image is clearly one color
+        model_color = scan_result.get("color")
+        if model_color not in get_args(ColorType):
+            logger.info("Model color invalid, using detected color",
+                        extra={"model_color": model_color, "detected_color": detected_color})
+            scan_result["color"] = detected_color
+        elif model_color != detected_color:
+            overridden = color_confidence >= COLOR_OVERRIDE_CONFIDENCE
+            logger.info("Model and detected color disagree",
+                        extra={"model_color": model_color, "detected_color": detected_color,
+                               "confidence": round(color_confidence, 3), "overridden": overridden})
+            if overridden:
+                scan_result["color"] = detected_color
+        scan_result["detected_color"] = detected_color
+        scan_result["scan_token"] = scan_token
+
+        logger.debug("Scan result from OpenAI", extra={"scan_result": scan_result})
 
         # Validate the response has required fields
         required_fields = ["title", "description", "color", "warmth", "formality"]
@@ -51,17 +85,48 @@ async def scan_clothing(
 
         # Validate against schema
         try:
-            response = ScanResponse(**scan_result)
-            print(f"✓ ScanResponse validation passed")
-            return response
+            return ScanResponse(**scan_result)
         except Exception as e:
-            print(f"✗ ScanResponse validation failed: {e}")
+            logger.warning("ScanResponse validation failed", extra={"error": str(e), "scan_result": scan_result})
             raise HTTPException(
                 status_code=500,
                 detail=f"AI response validation failed: {str(e)}"
             )
 
-    except HTTPException:
+    except (HTTPException, RateLimitExceeded):
+        if scan_token:
+            scan_prefetch_service.discard(scan_token)
+        raise
+    except Exception as e:
+        if scan_token:
+            scan_prefetch_service.discard(scan_token)
+        raise HTTPException(status_code=500, detail=f"Failed to process image: {str(e)}")
+
+@router.post("/color", response_model=ColorPreviewResponse)
+async def preview_color(
+    file: UploadFile = File(...),
+    authorization: str = Header(...)
+):
+    """
+    Estimate the item's primary color locally, without calling the model.
+    Returns in milliseconds so the preview can be prefilled while /scan/ runs.
+    """
+    try:
+        token = authorization.replace("Bearer ", "")
+        user_response = await asyncio.to_thread(supabase_service.get_user, token)
+        if not user_response.user:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        await rate_limiter.enforce(user_response.user.id)
+
+        image_data = await file.read()
+
+        if not image_service.validate_image(image_data):
+            raise HTTPException(status_code=400, detail="Invalid image file")
+
+        color, confidence = await asyncio.to_thread(image_service.extract_dominant_color, image_data)
+        return ColorPreviewResponse(color=color, confidence=confidence)
+
+    except (HTTPException, RateLimitExceeded):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process image: {str(e)}")
@@ -1,21 +1,50 @@
+import logging
 from fastapi import APIRouter, HTTPException, Header, File, UploadFile, Query, Form
+from fastapi.responses import StreamingResponse, ORJSONResponse, Response
+from pydantic import TypeAdapter, ValidationError
 from typing import Optional
-from app.models.schemas import WardrobeItem, WardrobeItemCreate, WardrobeItemUpdate
-from app.services.supabase_service import supabase_service
+from app.models.schemas import (
+    WardrobeItem, WardrobeItemCreate, WardrobeItemUpdate, WardrobeItemMetadata, OutfitSuggestion, WarmthType,
+    BulkUpdateRequest, BulkDeleteRequest, BulkDeleteResponse, ImportJobStatus, WardrobeChanges
+)
+from app.services.supabase_service import supabase_service, WardrobeLimitError
 from app.services.image_service import image_service
+from app.services.outfit_service import outfit_service
+from app.services.storage_reclaimer import storage_reclaimer
+from app.services.import_service import import_service
+from app.services.export_service import export_service
+from app.services.scan_prefetch import scan_prefetch_service
+from app.services.rate_limiter import rate_limiter
 import uuid
+import json
+import base64
+import asyncio
+import hashlib
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/wardrobe", tags=["wardrobe"])
 
-def get_user_id(authorization: str) -> str:
+# Max images per bulk create request (each is compressed and uploaded)
+BULK_CREATE_MAX_ITEMS = 20
+BULK_UPLOAD_CONCURRENCY = 4
+
+# Max page size for GET /wardrobe (the wardrobe limit, so one page can hold everything)
+MAX_PAGE_SIZE = 100
+
+# Columns returned for a wardrobe item; selecting exactly these lets rows be returned without re-validation
+ITEM_FIELDS = list(WardrobeItem.model_fields)
+
+async def get_user_id(authorization: str) -> str:
     """Helper function to extract and validate user ID from token."""
     try:
         token = authorization.replace("Bearer ", "")
-        user_response = supabase_service.get_user(token)
+        # Off the event loop, so concurrent identical checks can share one call
+        user_response = await asyncio.to_thread(supabase_service.get_user, token)
         if not user_response.user:
             raise HTTPException(status_code=401, detail="Invalid token")
-        return user_response.user.id
+        user_id = user_response.user.id
     except Exception as e:
         error_msg = str(e)
         if "expired" in error_msg.lower():
@@ -25,26 +54,153 @@ def get_user_id(authorization: str) -> str:
         else:
             raise HTTPException(status_code=401, detail=f"Authentication failed: {error_msg}")
 
+    # Charges this request's route cost to the user (429 once their bucket is empty)
+    await rate_limiter.enforce(user_id)
+    return user_id
+
+async def has_room(user_id: str, adding: int) -> bool:
+    """
+    Whether the wardrobe can take `adding` more items, checked before uploading images.
+
+    The cached count only knows about this process's writes, so when it says
+    full the database count is asked instead (deletes made elsewhere free room).
+    """
+    cached_count = supabase_service.cached_item_count(user_id)
+    if cached_count is None or cached_count + adding <= supabase_service.MAX_WARDROBE_ITEMS:
+        return True
+    count = await asyncio.to_thread(supabase_service.count_wardrobe_items, user_id)
+    return count + adding <= supabase_service.MAX_WARDROBE_ITEMS
+
+def store_image(user_id: str, file: UploadFile, image_data: bytes) -> tuple[str, str]:
+    """
+    Compress an uploaded image and store it under the user's folder. Returns (file_path, image_url).
+
+    The path stays pinned against storage reclaim; unpin it once the item row is inserted or the insert failed.
+    """
+    compressed_image = image_service.compress_image(image_data)
+
+    # Content-addressed (always JPEG after compression), so re-uploading the same photo reuses the object
+    file_path = supabase_service.image_path(user_id, compressed_image)
+
+    # Upload to Supabase Storage
+    image_url = storage_reclaimer.upload(file_path, compressed_image, "image/jpeg")
+    return file_path, image_url
+
+def encode_cursor(item: dict) -> str:
+    """Opaque keyset cursor for the row after which the next page starts."""
+    raw = json.dumps([str(item["created_at"]), item["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, item_id = json.loads(raw)
+        # Validate shape so nothing unexpected reaches the filter expression
+        datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        uuid.UUID(item_id)
+        return created_at, item_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.get("/", response_model=list[WardrobeItem])
 async def get_wardrobe(
     authorization: str = Header(...),
+    if_none_match: Optional[str] = Header(None),
     color: Optional[str] = Query(None),
     warmth: Optional[str] = Query(None),
     formality_min: Optional[int] = Query(None, ge=1, le=10),
-    formality_max: Optional[int] = Query(None, ge=1, le=10)
+    formality_max: Optional[int] = Query(None, ge=1, le=10),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Value of X-Next-Cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. id,title,image_url")
 ):
-    """Get all wardrobe items for the authenticated user with optional filters."""
-    user_id = get_user_id(authorization)
+    """
+    Get wardrobe items for the authenticated user with optional filters.
 
-    items = supabase_service.get_wardrobe_items(
+    Supports keyset pagination (limit + cursor, next cursor in X-Next-Cursor),
+    field projection, and conditional requests: the ETag is the user's
+    wardrobe version, so an unchanged wardrobe returns 304. Versions are per
+    user, so the tag also carries a hash of the user id; otherwise another
+    account at the same version on the same browser would get a 304.
+    """
+    user_id = await get_user_id(authorization)
+
+    selected_fields = ITEM_FIELDS
+    if fields:
+        selected_fields = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = set(selected_fields) - set(ITEM_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        # id and created_at are always needed to build the cursor
+        selected_fields = list(dict.fromkeys(["id", "created_at", *selected_fields]))
+
+    version = await asyncio.to_thread(supabase_service.get_wardrobe_version, user_id)
+    etag = f'W/"{hashlib.sha256(user_id.encode()).hexdigest()[:16]}-{version}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    items = await asyncio.to_thread(
+        supabase_service.get_wardrobe_items,
         user_id=user_id,
         color=color,
         warmth=warmth,
         formality_min=formality_min,
-        formality_max=formality_max
+        formality_max=formality_max,
+        fields=selected_fields,
+        limit=limit + 1 if limit else None,
+        after=decode_cursor(cursor) if cursor else None
     )
 
-    return items
+    if limit and len(items) > limit:
+        items = items[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(items[-1])
+
+    # Rows come from our own table (or its replica), which already enforces the
+    # WardrobeItem constraints, so they are serialized as-is instead of re-validated
+    return ORJSONResponse(content=items, headers=headers)
+
+@router.get("/changes", response_model=WardrobeChanges)
+async def get_wardrobe_changes(
+    authorization: str = Header(...),
+    since: int = Query(0, ge=0, description="Wardrobe version the client already has")
+):
+    """
+    Incremental sync: items inserted or updated and ids deleted since a wardrobe version.
+    since=0 returns the whole wardrobe.
+    """
+    user_id = await get_user_id(authorization)
+
+    changes = await asyncio.to_thread(supabase_service.get_wardrobe_changes, user_id, since)
+    # Trusted rows, as in get_wardrobe: drop internal columns (version) instead of re-validating
+    changes["upserted"] = [{name: row.get(name) for name in ITEM_FIELDS} for row in changes["upserted"]]
+    return ORJSONResponse(content=changes)
+
+@router.get("/outfits", response_model=list[OutfitSuggestion])
+async def get_outfits(
+    authorization: str = Header(...),
+    warmth: Optional[WarmthType] = Query(None),
+    formality_min: Optional[int] = Query(None, ge=1, le=10),
+    formality_max: Optional[int] = Query(None, ge=1, le=10),
+    limit: int = Query(5, ge=1, le=50)
+):
+    """
+    Suggest outfits from the user's wardrobe without calling the AI.
+    Combinations are scored for color harmony, target warmth and formality band.
+    """
+    user_id = await get_user_id(authorization)
+
+    items = await asyncio.to_thread(supabase_service.get_wardrobe_items, user_id=user_id)
+
+    return await asyncio.to_thread(
+        outfit_service.recommend,
+        items,
+        warmth=warmth,
+        formality_min=formality_min,
+        formality_max=formality_max,
+        limit=limit
+    )
 
 @router.post("/", response_model=WardrobeItem)
 async def create_wardrobe_item(
@@ -53,24 +209,24 @@ async def create_wardrobe_item(
     color: str = Form(...),
     warmth: str = Form(...),
     formality: str = Form(...),
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
+    scan_token: Optional[str] = Form(None, description="scan_token from POST /scan/; replaces the file"),
     authorization: str = Header(...)
 ):
     """
     Create a new wardrobe item with an image.
     This is called after the user confirms the scan preview.
+
+    With a scan_token the image uploaded during the scan is used. If the
+    token has expired (410), send the file instead.
     """
-    # Log incoming data for debugging
-    print(f"\n=== WARDROBE CREATE REQUEST ===")
-    print(f"Title: {title!r} (type: {type(title).__name__})")
-    print(f"Description: {description!r} (type: {type(description).__name__})")
-    print(f"Color: {color!r} (type: {type(color).__name__})")
-    print(f"Warmth: {warmth!r} (type: {type(warmth).__name__})")
-    print(f"Formality: {formality!r} (type: {type(formality).__name__})")
-    print(f"File: {file.filename if file else None}")
-    print(f"Authorization: {authorization[:20] if authorization else None}...")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Wardrobe create request", extra={
+            "title": title, "color": color, "warmth": warmth,
+            "formality": formality, "upload_filename": file.filename if file else None,
+        })
 
-    user_id = get_user_id(authorization)
+    user_id = await get_user_id(authorization)
 
     # Convert formality from string to int (FormData sends all values as strings)
     try:
@@ -78,7 +234,7 @@ async def create_wardrobe_item(
         if formality_int < 1 or formality_int > 10:
             raise ValueError("Formality must be between 1 and 10")
     except (ValueError, TypeError) as e:
-        print(f"Formality conversion error: {e}")
+        logger.info("Rejected create: invalid formality", extra={"formality": formality})
         raise HTTPException(status_code=400, detail=f"Invalid formality value: {str(e)}")
 
     # Validate color and warmth are in allowed values
@@ -86,40 +242,36 @@ async def create_wardrobe_item(
     valid_warmths = ["Cold", "Cool", "Neutral", "Warm", "Hot"]
 
     if color not in valid_colors:
-        print(f"Invalid color: {color!r}. Valid: {valid_colors}")
+        logger.info("Rejected create: invalid color", extra={"color": color})
         raise HTTPException(status_code=400, detail=f"Invalid color '{color}'. Must be one of: {', '.join(valid_colors)}")
 
     if warmth not in valid_warmths:
-        print(f"Invalid warmth: {warmth!r}. Valid: {valid_warmths}")
+        logger.info("Rejected create: invalid warmth", extra={"warmth": warmth})
         raise HTTPException(status_code=400, detail=f"Invalid warmth '{warmth}'. Must be one of: {', '.join(valid_warmths)}")
 
-    # Check wardrobe limit (100 items)
-    item_count = supabase_service.count_wardrobe_items(user_id)
-    if item_count >= 100:
-        raise HTTPException(
-            status_code=400,
-            detail="Wardrobe limit reached (100 items). Please delete some items first."
-        )
+    # Skip the upload when the wardrobe is full; the database enforces the limit atomically on insert
+    limit_detail = f"Wardrobe limit reached ({supabase_service.MAX_WARDROBE_ITEMS} items). Please delete some items first."
+    if not await has_room(user_id, 1):
+        raise HTTPException(status_code=400, detail=limit_detail)
 
-    try:
-        # Read and compress image
-        image_data = await file.read()
+    if not scan_token and file is None:
+        raise HTTPException(status_code=400, detail="Send either an image file or a scan_token")
 
-        if not image_service.validate_image(image_data):
-            raise HTTPException(status_code=400, detail="Invalid image file")
-
-        compressed_image = image_service.compress_image(image_data)
+    try:
+        claimed = await scan_prefetch_service.claim(scan_token, user_id) if scan_token else None
+        if claimed:
+            file_path, image_url = claimed
+        elif file is None:
+            raise HTTPException(status_code=410, detail="Scan token expired or unknown. Please send the image file.")
+        else:
+            # Read and compress image
+            image_data = await file.read()
 
-        # Generate unique filename
-        file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'jpg'
-        file_path = f"{user_id}/{uuid.uuid4()}.{file_extension}"
+            if not image_service.validate_image(image_data):
+                raise HTTPException(status_code=400, detail="Invalid image file")
 
-        # Upload to Supabase Storage
-        image_url = supabase_service.upload_image(
-            file_path=file_path,
-            file_data=compressed_image,
-            content_type=file.content_type or "image/jpeg"
-        )
+            # Compression and upload run in a thread so other requests keep being served
+            file_path, image_url = await asyncio.to_thread(store_image, user_id, file, image_data)
 
         # Create wardrobe item in database
         item_data = {
@@ -131,7 +283,14 @@ async def create_wardrobe_item(
             "image_url": image_url
         }
 
-        created_item = supabase_service.create_wardrobe_item(user_id, item_data)
+        try:
+            created_item = await asyncio.to_thread(supabase_service.create_wardrobe_item_limited, user_id, item_data)
+        except WardrobeLimitError:
+            # Lost the race to a concurrent upload - drop the orphaned image (unless another item uses it)
+            storage_reclaimer.enqueue([file_path])
+            raise HTTPException(status_code=400, detail=limit_detail)
+        finally:
+            storage_reclaimer.unpin([file_path])
 
         if not created_item:
             raise HTTPException(status_code=500, detail="Failed to create wardrobe item")
@@ -143,6 +302,154 @@ async def create_wardrobe_item(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create item: {str(e)}")
 
+@router.post("/bulk/create", response_model=list[WardrobeItem])
+async def bulk_create_wardrobe_items(
+    items: str = Form(..., description="JSON array of scanned item metadata, one per file"),
+    files: list[UploadFile] = File(...),
+    authorization: str = Header(...)
+):
+    """
+    Create several wardrobe items from already-scanned results in one request.
+    Images are uploaded concurrently and all rows are inserted in a single statement.
+    """
+    user_id = await get_user_id(authorization)
+
+    try:
+        metadata = TypeAdapter(list[WardrobeItemMetadata]).validate_json(items)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid items: {str(e)}")
+
+    if len(metadata) != len(files):
+        raise HTTPException(status_code=400, detail="Number of items must match number of files")
+    if not metadata or len(metadata) > BULK_CREATE_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Provide between 1 and {BULK_CREATE_MAX_ITEMS} items")
+
+    limit_detail = f"Wardrobe limit reached ({supabase_service.MAX_WARDROBE_ITEMS} items). Please delete some items first."
+    if not await has_room(user_id, len(metadata)):
+        raise HTTPException(status_code=400, detail=limit_detail)
+
+    images = [await file.read() for file in files]
+    for file, image_data in zip(files, images):
+        if not image_service.validate_image(image_data):
+            raise HTTPException(status_code=400, detail=f"Invalid image file: {file.filename}")
+
+    uploaded_paths = []
+    try:
+        semaphore = asyncio.Semaphore(BULK_UPLOAD_CONCURRENCY)
+
+        async def upload(file: UploadFile, image_data: bytes) -> str:
+            async with semaphore:
+                file_path, image_url = await asyncio.to_thread(store_image, user_id, file, image_data)
+                uploaded_paths.append(file_path)
+                return image_url
+
+        # Wait for every upload, even after one fails, so uploaded_paths is complete for the cleanup below
+        image_urls = await asyncio.gather(*(upload(file, data) for file, data in zip(files, images)),
+                                          return_exceptions=True)
+        failed = next((result for result in image_urls if isinstance(result, BaseException)), None)
+        if failed is not None:
+            raise failed
+
+        rows = [
+            {**item.model_dump(), "image_url": image_url}
+            for item, image_url in zip(metadata, image_urls)
+        ]
+        return await asyncio.to_thread(supabase_service.create_wardrobe_items_limited, user_id, rows)
+
+    except WardrobeLimitError:
+        storage_reclaimer.enqueue(uploaded_paths)
+        raise HTTPException(status_code=400, detail=limit_detail)
+    except Exception as e:
+        storage_reclaimer.enqueue(uploaded_paths)
+        raise HTTPException(status_code=500, detail=f"Failed to create items: {str(e)}")
+    finally:
+        storage_reclaimer.unpin(uploaded_paths)
+
+@router.post("/bulk/update", response_model=list[WardrobeItem])
+async def bulk_update_wardrobe_items(
+    request: BulkUpdateRequest,
+    authorization: str = Header(...)
+):
+    """Apply the same metadata update to several items in one query."""
+    user_id = await get_user_id(authorization)
+
+    update_data = {k: v for k, v in request.update.model_dump().items() if v is not None}
+
+    if not update_data:
+        raise HTTPException(status_code=400, detail="No fields to update")
+
+    return await asyncio.to_thread(supabase_service.update_wardrobe_items, request.item_ids, user_id, update_data)
+
+@router.post("/bulk/delete", response_model=BulkDeleteResponse)
+async def bulk_delete_wardrobe_items(
+    request: BulkDeleteRequest,
+    authorization: str = Header(...)
+):
+    """Delete several items in one query; their images are removed in a background batch."""
+    user_id = await get_user_id(authorization)
+
+    deleted = await asyncio.to_thread(supabase_service.delete_wardrobe_items, request.item_ids, user_id)
+
+    storage_reclaimer.enqueue([
+        supabase_service.image_path_from_url(row["image_url"]) for row in deleted if row.get("image_url")
+    ])
+
+    return BulkDeleteResponse(
+        message=f"Deleted {len(deleted)} items",
+        deleted_ids=[row["id"] for row in deleted]
+    )
+
+@router.post("/import", response_model=ImportJobStatus, status_code=202)
+async def import_wardrobe(
+    file: UploadFile = File(...),
+    authorization: str = Header(...)
+):
+    """
+    Import a zip of clothing photos. Each image is scanned with GPT-4o Vision and saved.
+    Runs in the background; poll GET /wardrobe/import/{job_id} for progress.
+    """
+    user_id = await get_user_id(authorization)
+
+    archive = await asyncio.to_thread(import_service.spool_upload, file.file)
+    try:
+        job = import_service.start_import(user_id, archive)
+    except ValueError as e:
+        archive.close()
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return ImportJobStatus(**vars(job))
+
+@router.get("/import/{job_id}", response_model=ImportJobStatus)
+async def get_import_status(
+    job_id: str,
+    authorization: str = Header(...)
+):
+    """Get progress of a zip import."""
+    user_id = await get_user_id(authorization)
+
+    job = import_service.get_job(job_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import not found")
+
+    return ImportJobStatus(**vars(job))
+
+@router.get("/export")
+async def export_wardrobe(authorization: str = Header(...)):
+    """
+    Download the whole wardrobe as a zip of item images plus a JSON/CSV manifest.
+    The archive is streamed as it is built.
+    """
+    user_id = await get_user_id(authorization)
+
+    items = await asyncio.to_thread(supabase_service.get_wardrobe_items, user_id=user_id)
+
+    filename = f"wardrobe-export-{datetime.utcnow().strftime('%Y%m%d')}.zip"
+    return StreamingResponse(
+        export_service.stream_archive(items),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @router.put("/{item_id}", response_model=WardrobeItem)
 async def update_wardrobe_item(
     item_id: str,
@@ -150,7 +457,7 @@ async def update_wardrobe_item(
     authorization: str = Header(...)
 ):
     """Update an existing wardrobe item's metadata (not the image)."""
-    user_id = get_user_id(authorization)
+    user_id = await get_user_id(authorization)
 
     # Filter out None values
     update_data = {k: v for k, v in item_update.model_dump().items() if v is not None}
@@ -158,7 +465,7 @@ async def update_wardrobe_item(
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
 
-    updated_item = supabase_service.update_wardrobe_item(item_id, user_id, update_data)
+    updated_item = await asyncio.to_thread(supabase_service.update_wardrobe_item, item_id, user_id, update_data)
 
     if not updated_item:
         raise HTTPException(status_code=404, detail="Item not found or unauthorized")
@@ -171,11 +478,16 @@ async def delete_wardrobe_item(
     authorization: str = Header(...)
 ):
     """Delete a wardrobe item and its associated image."""
-    user_id = get_user_id(authorization)
+    user_id = await get_user_id(authorization)
 
-    deleted = supabase_service.delete_wardrobe_item(item_id, user_id)
+    deleted = await asyncio.to_thread(supabase_service.delete_wardrobe_item, item_id, user_id)
 
     if not deleted:
         raise HTTPException(status_code=404, detail="Item not found or unauthorized")
 
+    # Storage cleanup happens in the background
+    storage_reclaimer.enqueue([
+        supabase_service.image_path_from_url(row["image_url"]) for row in deleted if row.get("image_url")
+    ])
+
     return {"message": "Item deleted successfully"}
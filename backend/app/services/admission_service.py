@@ -0,0 +1,181 @@
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+from app.services.metrics_service import metrics_service
+
+class AdmissionRejected(Exception):
+    """A pool is saturated; the caller should answer 503 with Retry-After."""
+
+    def __init__(self, pool: str, retry_after: int):
+        super().__init__(f"{pool} pool saturated")
+        self.pool = pool
+        self.retry_after = retry_after
+
+class AdmissionPool:
+    """
+    Concurrency limit with a bounded FIFO queue for one class of endpoints.
+
+    A request runs at once if a slot is free, otherwise it waits in the
+    queue for at most queue_timeout seconds. A request that finds the queue
+    full, or whose wait runs out, is rejected instead, with a Retry-After
+    estimated from recent service times.
+    """
+
+    def __init__(self, name: str, limit: int, queue_limit: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_limit = queue_limit
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.rejected = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        # Exponentially weighted mean of how long admitted requests hold a slot
+        self._service_seconds = 0.1
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        """Take a slot, waiting in the queue if needed. False means rejected."""
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return True
+        if len(self._waiters) >= self.queue_limit:
+            self._reject("queue_full")
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # The slot was handed over just as the deadline passed
+                return True
+            self._reject("queue_timeout")
+            return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Cancelled after release() handed us the slot: pass it on, or it is lost for good
+                self._hand_off()
+            raise
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self, elapsed: float):
+        """Give back a slot (directly to the next waiter, if any)."""
+        self._service_seconds += 0.2 * (elapsed - self._service_seconds)
+        self._hand_off()
+
+    def _hand_off(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot passes straight to the waiter; in_flight is unchanged
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def retry_after(self) -> int:
+        """Seconds until a retry is likely to be admitted."""
+        return max(1, math.ceil(self._service_seconds * (self.queued + 1) / self.limit))
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        metrics_service.admission_rejections.inc(self.name, reason)
+
+    def status(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "limit": self.limit,
+            "queued": self.queued,
+            "queue_limit": self.queue_limit,
+            "rejected": self.rejected,
+            "saturated": self.in_flight >= self.limit and self.queued >= self.queue_limit,
+        }
+
+class AdmissionService:
+    """
+    Admission control per endpoint class, so a slow class cannot starve the
+    others:
+
+    - reads: GETs (wardrobe, outfits, changes, ...)
+    - writes: other wardrobe and auth calls, and local image work (/scan/color)
+    - model: endpoints that call OpenAI (/scan/, /chat/)
+
+    Each class has its own AdmissionPool; a saturated class gets a fast 503
+    with Retry-After. Health, metrics and docs are not limited; /chat/ws
+    connections are not either, but each chat turn on one takes a model slot.
+    Limits are set with ADMISSION_<CLASS>_CONCURRENCY, ADMISSION_<CLASS>_QUEUE
+    and ADMISSION_<CLASS>_QUEUE_TIMEOUT_SECONDS.
+    """
+
+    DEFAULTS = {
+        # class: (concurrency, queue, queue timeout seconds)
+        "reads": (64, 256, 2.0),
+        "writes": (16, 64, 5.0),
+        "model": (16, 32, 10.0),
+    }
+    MODEL_ROUTES = {("POST", "/scan/"), ("POST", "/chat/")}
+    UNLIMITED_PATHS = {"/", "/health", "/metrics", "/docs", "/redoc", "/openapi.json"}
+
+    def __init__(self):
+        self.enabled = os.getenv("ADMISSION_CONTROL", "true").lower() == "true"
+        self.pools: dict[str, AdmissionPool] = {}
+        for name, (limit, queue_limit, queue_timeout) in self.DEFAULTS.items():
+            prefix = f"ADMISSION_{name.upper()}"
+            self.pools[name] = AdmissionPool(
+                name,
+                int(os.getenv(f"{prefix}_CONCURRENCY", str(limit))),
+                int(os.getenv(f"{prefix}_QUEUE", str(queue_limit))),
+                float(os.getenv(f"{prefix}_QUEUE_TIMEOUT_SECONDS", str(queue_timeout))),
+            )
+
+    def classify(self, method: str, path: str) -> Optional[str]:
+        """Pool name for a request, or None if it is not limited."""
+        if path in self.UNLIMITED_PATHS or method == "OPTIONS":
+            return None
+        # Routes are registered with a trailing slash; accept the request either way
+        if (method, path.rstrip("/") + "/") in self.MODEL_ROUTES:
+            return "model"
+        if method in ("GET", "HEAD"):
+            return "reads"
+        return "writes"
+
+    @asynccontextmanager
+    async def slot(self, name: str):
+        """Hold a slot in a pool for the duration of the block; raises AdmissionRejected if saturated."""
+        if not self.enabled:
+            yield
+            return
+        pool = self.pools[name]
+        if not await pool.acquire():
+            raise AdmissionRejected(name, pool.retry_after())
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            pool.release(time.perf_counter() - start)
+
+    def thread_budget(self, reserved: int = 0) -> int:
+        """
+        Worker threads needed for every admitted request to block in one, plus
+        background work; reserved covers blocking work bounded outside these
+        pools (zip import scans).
+        """
+        return sum(pool.limit for pool in self.pools.values()) + reserved + 16
+
+    def status(self) -> dict:
+        return {name: pool.status() for name, pool in self.pools.items()}
+
+# Singleton instance
+admission_service = AdmissionService()
@@ -0,0 +1,155 @@
+import os
+import re
+import time
+import zlib
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+@dataclass
+class _CacheEntry:
+    scope: str
+    response: str
+    expires_at: float
+    vector: Optional[np.ndarray]
+    normalized: str
+
+class ChatCache:
+    """
+    Response cache in front of the AI stylist.
+
+    Exact tier: keyed on the normalized message, the chat history and a
+    fingerprint of the user's wardrobe, so any wardrobe edit invalidates it.
+    Semantic tier (off by default, CHAT_CACHE_SEMANTIC=true): for first-turn
+    questions, a local hashed n-gram embedding finds near-identical earlier
+    questions against the same wardrobe. The embedding scores "interview at
+    a bank" and "interview at a startup" as near-identical, so a match is
+    only served if both questions have the same content words and neither
+    or both are negated; in effect it catches rewordings that differ in
+    filler words, order or punctuation. Both tiers share TTL and LRU
+    eviction. Everything is in-process and CPU-only.
+    """
+
+    EMBEDDING_DIMENSION = 1024
+
+    # Words that do not change what is being asked; negations are deliberately not here
+    STOPWORDS = frozenset("""
+        a an the to for of in on at by with and or but i me my im we you your it its is are am be
+        should would could can do does did what which how wear wearing put on some any this that
+        please tell suggest recommend outfit outfits something good best go going
+    """.split())
+    _NEGATION = re.compile(r"\b(not|no|never|nor|without|cannot|dont|cant|wont|\w+n t)\b")
+
+    def __init__(self):
+        self.max_entries = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "512"))
+        self.ttl_seconds = float(os.getenv("CHAT_CACHE_TTL_SECONDS", "3600"))
+        self.semantic_enabled = os.getenv("CHAT_CACHE_SEMANTIC", "false").lower() == "true"
+        self.similarity_threshold = float(os.getenv("CHAT_CACHE_SIMILARITY", "0.9"))
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(message: str) -> str:
+        """Lowercase, strip punctuation and collapse whitespace."""
+        message = re.sub(r"[^\w\s]", " ", message.lower())
+        return " ".join(message.split())
+
+    @staticmethod
+    def wardrobe_version(wardrobe_items: list) -> str:
+        """Fingerprint of the wardrobe fields the stylist sees."""
+        digest = hashlib.sha1()
+        for item in sorted(wardrobe_items, key=lambda item: item["id"]):
+            digest.update(
+                f"{item['id']}|{item['title']}|{item['description']}|{item['color']}|{item['warmth']}|{item['formality']}\n".encode()
+            )
+        return digest.hexdigest()
+
+    @classmethod
+    def _embed(cls, normalized: str) -> np.ndarray:
+        """Hashed word + character trigram embedding, L2-normalized."""
+        vector = np.zeros(cls.EMBEDDING_DIMENSION, dtype=np.float32)
+        words = normalized.split()
+        features = list(words)
+        padded = f" {normalized} "
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        for feature in features:
+            vector[zlib.crc32(feature.encode()) % cls.EMBEDDING_DIMENSION] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @classmethod
+    def _same_question(cls, first: str, second: str) -> bool:
+        """Guard for similarity hits: same content words and the same negation (normalized messages)."""
+        if bool(cls._NEGATION.search(first)) != bool(cls._NEGATION.search(second)):
+            return False
+        return set(first.split()) - cls.STOPWORDS == set(second.split()) - cls.STOPWORDS
+
+    @staticmethod
+    def _key(scope: str, normalized: str, history: list) -> str:
+        history_digest = hashlib.sha1(
+            "\n".join(f"{msg['role']}:{msg['content']}" for msg in history).encode()
+        ).hexdigest()
+        return f"{scope}|{history_digest}|{normalized}"
+
+    def _evict_expired(self, now: float):
+        expired = [key for key, entry in self._entries.items() if entry.expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self, user_id: str, wardrobe_version: str, message: str, history: list) -> Optional[str]:
+        """Return a cached stylist response, or None."""
+        scope = f"{user_id}:{wardrobe_version}"
+        normalized = self.normalize(message)
+        key = self._key(scope, normalized, history)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                return entry.response
+
+            if not self.semantic_enabled or history:
+                return None
+
+            candidates = [
+                (cache_key, cached) for cache_key, cached in self._entries.items()
+                if cached.scope == scope and cached.vector is not None and cached.expires_at > now
+            ]
+            if not candidates:
+                return None
+
+            query = self._embed(normalized)
+            similarities = np.stack([cached.vector for _, cached in candidates]) @ query
+            # Most similar first; the first one that passes the guard is served
+            for index in np.argsort(-similarities):
+                if similarities[index] < self.similarity_threshold:
+                    return None
+                cache_key, cached = candidates[index]
+                if self._same_question(normalized, cached.normalized):
+                    self._entries.move_to_end(cache_key)
+                    return cached.response
+            return None
+
+    def put(self, user_id: str, wardrobe_version: str, message: str, history: list, response: str):
+        """Store a stylist response."""
+        scope = f"{user_id}:{wardrobe_version}"
+        normalized = self.normalize(message)
+        key = self._key(scope, normalized, history)
+        # Only first-turn questions take part in similarity matching
+        vector = self._embed(normalized) if self.semantic_enabled and not history else None
+        now = time.monotonic()
+
+        with self._lock:
+            self._entries[key] = _CacheEntry(scope, response, now + self.ttl_seconds, vector, normalized)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._evict_expired(now)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+# Singleton instance
+chat_cache = ChatCache()
@@ -0,0 +1,84 @@
+import os
+import time
+import threading
+from typing import Optional
+from app.services.supabase_service import supabase_service
+from app.services.chat_cache import chat_cache
+
+class ChatSession:
+    """
+    Server-side state of one /chat/ws connection: the user, their wardrobe
+    and the conversation so far.
+
+    The wardrobe is loaded once and reloaded only when its version changes
+    (checked at most every wardrobe_check_seconds). The history is compacted
+    as it grows, so follow-up turns send a bounded prompt.
+    """
+
+    def __init__(self, user_id: str, max_history_messages: int, recent_messages: int,
+                 compact_chars: int, wardrobe_check_seconds: float):
+        self.user_id = user_id
+        self.max_history_messages = max_history_messages
+        self.recent_messages = recent_messages
+        self.compact_chars = compact_chars
+        self.wardrobe_check_seconds = wardrobe_check_seconds
+        self.history: list[dict] = []
+        self.wardrobe_items: list = []
+        self.wardrobe_version: Optional[int] = None
+        self.cache_version = ""  # chat_cache fingerprint of wardrobe_items
+        self._checked_at = 0.0
+
+    def load_wardrobe(self):
+        """Fetch the wardrobe (blocking; run in a thread)."""
+        self.wardrobe_version = supabase_service.get_wardrobe_version(self.user_id)
+        self.wardrobe_items = supabase_service.get_wardrobe_items(self.user_id)
+        self.cache_version = chat_cache.wardrobe_version(self.wardrobe_items)
+        self._checked_at = time.monotonic()
+
+    def refresh_wardrobe(self, force: bool = False):
+        """Reload the wardrobe if it changed since it was loaded (blocking; run in a thread)."""
+        if not force and time.monotonic() - self._checked_at < self.wardrobe_check_seconds:
+            return
+        if force or supabase_service.get_wardrobe_version(self.user_id) != self.wardrobe_version:
+            self.load_wardrobe()
+        else:
+            self._checked_at = time.monotonic()
+
+    def add_turn(self, user_message: str, reply: str):
+        """Append a completed exchange and compact the history."""
+        self.history += [{"role": "user", "content": user_message}, {"role": "assistant", "content": reply}]
+        # Drop the oldest exchanges, then shorten replies outside the recent window
+        del self.history[:max(0, len(self.history) - self.max_history_messages)]
+        for message in self.history[:-self.recent_messages or None]:
+            if message["role"] == "assistant" and len(message["content"]) > self.compact_chars:
+                message["content"] = message["content"][:self.compact_chars].rstrip() + " …"
+
+class ChatSessionService:
+    """Creates chat sessions and tracks how many are open on this node."""
+
+    def __init__(self):
+        self.max_history_messages = int(os.getenv("CHAT_WS_HISTORY_MESSAGES", "20"))
+        # The last few messages are kept verbatim; older assistant replies are cut to compact_chars
+        self.recent_messages = int(os.getenv("CHAT_WS_RECENT_MESSAGES", "4"))
+        self.compact_chars = int(os.getenv("CHAT_WS_COMPACT_CHARS", "400"))
+        self.wardrobe_check_seconds = float(os.getenv("CHAT_WS_WARDROBE_CHECK_SECONDS", "30"))
+        self.auth_timeout = float(os.getenv("CHAT_WS_AUTH_TIMEOUT_SECONDS", "10"))
+        self._active = 0
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def open(self, user_id: str) -> ChatSession:
+        with self._lock:
+            self._active += 1
+        return ChatSession(user_id, self.max_history_messages, self.recent_messages,
+                           self.compact_chars, self.wardrobe_check_seconds)
+
+    def close(self, session: ChatSession):
+        with self._lock:
+            self._active -= 1
+
+# Singleton instance
+chat_session_service = ChatSessionService()
@@ -1,25 +1,60 @@
-from PIL import Image
+import numpy as np
 from io import BytesIO
+from typing import Callable, Optional, TYPE_CHECKING
+from app.services.metrics_service import metrics_service
+
+# Pillow is imported where it is used so that importing the routers (and
+# cold start) does not pay for it; the warm-up task loads it in the background.
+if TYPE_CHECKING:
+    from PIL import Image
 
 class ImageService:
     MAX_SIZE_BYTES = 2 * 1024 * 1024  # 2MB
     MAX_DIMENSION = 1920  # Max width or height
 
+    # Vision model input - GPT-4o does not need the full-size display image
+    VISION_MAX_DIMENSION = 768  # Max width or height sent to the model
+    VISION_QUALITY = 80  # JPEG quality for the model input
+
+    # Local color extraction
+    COLOR_SAMPLE_DIMENSION = 64  # Bitmap size used for clustering
+    COLOR_CLUSTERS = 4
+    COLOR_ITERATIONS = 8
+    # Reference sRGB swatches for each ColorType; several per label cover common shades
+    COLOR_REFERENCES = {
+        "Black": [(20, 20, 20), (40, 40, 45)],
+        "White": [(245, 245, 245), (230, 228, 220)],
+        "Gray": [(128, 128, 128), (90, 90, 95), (180, 180, 180)],
+        "Blue": [(40, 70, 160), (25, 35, 70), (100, 150, 210), (70, 100, 140)],
+        "Brown": [(110, 70, 40), (70, 45, 30), (190, 160, 120), (150, 110, 70)],
+        "Green": [(50, 120, 60), (85, 95, 50), (30, 70, 45), (140, 190, 120)],
+        "Red": [(190, 30, 40), (120, 20, 35)],
+        "Pink": [(240, 150, 180), (220, 90, 140)],
+        "Yellow": [(235, 205, 60), (240, 225, 140)],
+        "Purple": [(110, 50, 140), (70, 35, 90), (170, 130, 200)],
+        "Orange": [(235, 120, 30), (200, 90, 40)],
+    }
+
     @staticmethod
-    def compress_image(image_data: bytes, max_size_bytes: int = MAX_SIZE_BYTES) -> bytes:
+    def _load_rgb(image_data: bytes, draft_size: Optional[int] = None) -> "Image.Image":
         """
-        Compress an image to be under max_size_bytes while maintaining quality.
+        Decode image bytes into an RGB image, flattening transparency onto white.
 
         Args:
             image_data: Original image bytes
-            max_size_bytes: Maximum file size in bytes (default 2MB)
+            draft_size: If set, let the JPEG decoder downscale while decoding
+                        (much cheaper when only a small image is needed)
 
         Returns:
-            Compressed image bytes
+            RGB PIL image
         """
-        # Open image
+        from PIL import Image
+
         img = Image.open(BytesIO(image_data))
 
+        if draft_size is not None and img.format == 'JPEG':
+            img.draft('RGB', (draft_size, draft_size))
+
         # Convert RGBA to RGB if necessary
         if img.mode in ('RGBA', 'LA', 'P'):
             background = Image.new('RGB', img.size, (255, 255, 255))
@@ -27,10 +62,20 @@ class ImageService:
                 img = img.convert('RGBA')
             background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
             img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        return img
+
+    @staticmethod
+    def _compress_loaded(img: "Image.Image", max_size_bytes: int = MAX_SIZE_BYTES) -> bytes:
+        """Resize and JPEG-encode an already decoded image for storage."""
+        from PIL import Image
 
         # Resize if too large
         max_dim = ImageService.MAX_DIMENSION
         if img.width > max_dim or img.height > max_dim:
+            img = img.copy()
             img.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
 
         # Compress with progressively lower quality until under size limit
@@ -49,6 +94,153 @@ class ImageService:
 
         return output.getvalue()
 
+    @staticmethod
+    def _vision_from_loaded(img: "Image.Image") -> bytes:
+        """Downscale and JPEG-encode an already decoded image for the vision model."""
+        from PIL import Image
+
+        max_dim = ImageService.VISION_MAX_DIMENSION
+        if img.width > max_dim or img.height > max_dim:
+            img = img.copy()
+            # The model only needs garment shape and color, so a cheaper filter is fine
+            img.thumbnail((max_dim, max_dim), Image.Resampling.BICUBIC)
+
+        output = BytesIO()
+        img.save(output, format='JPEG', quality=ImageService.VISION_QUALITY)
+        return output.getvalue()
+
+    @staticmethod
+    @metrics_service.image("compress_image")
+    def compress_image(image_data: bytes, max_size_bytes: int = MAX_SIZE_BYTES) -> bytes:
+        """
+        Compress an image to be under max_size_bytes while maintaining quality.
+
+        Args:
+            image_data: Original image bytes
+            max_size_bytes: Maximum file size in bytes (default 2MB)
+
+        Returns:
+            Compressed image bytes
+        """
+        img = ImageService._load_rgb(image_data)
+        return ImageService._compress_loaded(img, max_size_bytes)
+
+    @staticmethod
+    @metrics_service.image("compress_for_vision")
+    def compress_for_vision(image_data: bytes) -> bytes:
+        """
+        Produce the small JPEG sent to GPT-4o Vision.
+
+        The stored image is kept at display resolution; the model gets a
+        VISION_MAX_DIMENSION-bounded copy that is a fraction of the size.
+
+        Returns:
+            Vision-input image bytes
+        """
+        img = ImageService._load_rgb(image_data, draft_size=ImageService.VISION_MAX_DIMENSION)
+        return ImageService._vision_from_loaded(img)
+
+    @staticmethod
+    @metrics_service.image("compress_image_variants")
+    def compress_image_variants(image_data: bytes, max_size_bytes: int = MAX_SIZE_BYTES,
+                                on_vision: Optional[Callable[[bytes], None]] = None) -> tuple[bytes, bytes]:
+        """
+        Decode an image once and produce both the stored and vision-input variants.
+
+        Args:
+            on_vision: Called with the vision variant as soon as it is ready,
+                       before the (slower) stored variant is compressed
+
+        Returns:
+            Tuple of (stored image bytes, vision image bytes)
+        """
+        img = ImageService._load_rgb(image_data)
+        vision = ImageService._vision_from_loaded(img)
+        if on_vision is not None:
+            on_vision(vision)
+        stored = ImageService._compress_loaded(img, max_size_bytes)
+        return stored, vision
+
+    @staticmethod
+    def _rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+        """Convert an (..., 3) array of sRGB values in [0, 1] to CIE Lab (D65)."""
+        linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+        matrix = np.array([
+            [0.4124564, 0.3575761, 0.1804375],
+            [0.2126729, 0.7151522, 0.0721750],
+            [0.0193339, 0.1191920, 0.9503041],
+        ], dtype=np.float32)
+        xyz = linear @ matrix.T
+        xyz /= np.array([0.95047, 1.0, 1.08883], dtype=np.float32)
+
+        delta = 6 / 29
+        f = np.where(xyz > delta ** 3, np.cbrt(xyz), xyz / (3 * delta ** 2) + 4 / 29)
+        lab = np.empty_like(f)
+        lab[..., 0] = 116 * f[..., 1] - 16
+        lab[..., 1] = 500 * (f[..., 0] - f[..., 1])
+        lab[..., 2] = 200 * (f[..., 1] - f[..., 2])
+        return lab
+
+    @staticmethod
+    def _reference_palette() -> tuple[np.ndarray, list[str]]:
+        """Reference swatches in Lab, with the ColorType label of each row."""
+        labels = []
+        swatches = []
+        for label, shades in ImageService.COLOR_REFERENCES.items():
+            for shade in shades:
+                labels.append(label)
+                swatches.append(shade)
+        rgb = np.array(swatches, dtype=np.float32) / 255.0
+        return ImageService._rgb_to_lab(rgb), labels
+
+    @staticmethod
+    @metrics_service.image("extract_dominant_color")
+    def extract_dominant_color(image_data: bytes) -> tuple[str, float]:
+        """
+        Estimate the garment's primary color locally, without calling the model.
+
+        Runs a center-weighted k-means in Lab space over a small downsampled
+        bitmap, then maps the heaviest cluster to the nearest ColorType swatch.
+
+        Returns:
+            Tuple of (ColorType value, confidence in [0, 1] - the weight share
+            of the dominant cluster)
+        """
+        from PIL import Image
+
+        size = ImageService.COLOR_SAMPLE_DIMENSION
+        img = ImageService._load_rgb(image_data, draft_size=size * 2)
+        img.thumbnail((size, size), Image.Resampling.BILINEAR)
+
+        rgb = np.asarray(img, dtype=np.float32) / 255.0
+        height, width = rgb.shape[:2]
+        pixels = ImageService._rgb_to_lab(rgb).reshape(-1, 3)
+
+        # Gaussian center weighting - product photos put the garment in the middle
+        ys = (np.arange(height, dtype=np.float32) - (height - 1) / 2) / max(height, 1)
+        xs = (np.arange(width, dtype=np.float32) - (width - 1) / 2) / max(width, 1)
+        weights = np.exp(-(ys[:, None] ** 2 + xs[None, :] ** 2) / (2 * 0.3 ** 2)).reshape(-1)
+
+        # Deterministic init: spread seeds across the lightness range
+        k = min(ImageService.COLOR_CLUSTERS, len(pixels))
+        order = np.argsort(pixels[:, 0])
+        centers = pixels[order[np.linspace(0, len(pixels) - 1, k).astype(int)]].copy()
+
+        for _ in range(ImageService.COLOR_ITERATIONS):
+            distances = ((pixels[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+            assignment = distances.argmin(axis=1)
+            cluster_weights = np.bincount(assignment, weights=weights, minlength=k)
+            for axis in range(3):
+                sums = np.bincount(assignment, weights=weights * pixels[:, axis], minlength=k)
+                np.divide(sums, cluster_weights, out=centers[:, axis], where=cluster_weights > 0)
+
+        dominant = int(cluster_weights.argmax())
+        confidence = float(cluster_weights[dominant] / cluster_weights.sum())
+
+        palette, labels = ImageService._reference_palette()
+        nearest = int(((palette - centers[dominant]) ** 2).sum(axis=1).argmin())
+        return labels[nearest], confidence
+
     @staticmethod
     def validate_image(image_data: bytes) -> bool:
         """
@@ -57,6 +249,8 @@ class ImageService:
         Returns:
             True if valid image, False otherwise
         """
+        from PIL import Image
+
         try:
             img = Image.open(BytesIO(image_data))
             img.verify()
@@ -64,5 +258,29 @@ class ImageService:
         except Exception:
             return False
 
+    @staticmethod
+    def warm_up():
+        """Import Pillow and load its JPEG codec by round-tripping a tiny image."""
+        from PIL import Image
+
+        output = BytesIO()
+        Image.new('RGB', (16, 16)).save(output, format='JPEG')
+        # Private helpers, so warm-up does not show up in the image metrics
+        ImageService._vision_from_loaded(ImageService._load_rgb(output.getvalue()))
+
+def prepare_image_variants(image_data: bytes) -> Optional[tuple[bytes, bytes, str]]:
+    """
+    Validate an image, decode it once and build the stored image, the
+    vision-model image and the local color estimate.
+
+    Module-level so it can run in a process pool. Returns None if the data
+    is not a readable image.
+    """
+    if not ImageService.validate_image(image_data):
+        return None
+    stored, vision = ImageService.compress_image_variants(image_data)
+    color, _ = ImageService.extract_dominant_color(vision)
+    return stored, vision, color
+
 # Singleton instance
 image_service = ImageService()
@@ -0,0 +1,233 @@
+import os
+import time
+import uuid
+import asyncio
+import hashlib
+import zipfile
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import BinaryIO, Optional, get_args
+from app.models.schemas import WardrobeItemMetadata, ColorType
+from app.services.image_service import prepare_image_variants
+from app.services.openai_service import openai_service
+from app.services.supabase_service import supabase_service, WardrobeLimitError
+from app.services.storage_reclaimer import storage_reclaimer
+from app.services.rate_limiter import rate_limiter, RateLimitExceeded
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".heic", ".gif", ".bmp")
+
+@dataclass
+class ImportJob:
+    job_id: str
+    user_id: str
+    status: str = "running"  # running, completed, limit_reached, rate_limited, failed
+    total: int = 0
+    processed: int = 0
+    created: int = 0
+    duplicates: int = 0
+    failed: int = 0
+    item_ids: list[str] = field(default_factory=list)
+    errors: list[dict] = field(default_factory=list)
+    finished_at: Optional[float] = None
+
+class ImportService:
+    """
+    Zip bulk import for wardrobe onboarding.
+
+    Entries are streamed out of the archive one at a time (never extracted to
+    disk) and flow through overlapping stages: decode/compress in a process
+    pool, dedup by content hash, Vision scanning with bounded concurrency,
+    then storage upload and insert. Progress is kept on an in-memory job.
+
+    Each scanned entry is charged to the user's rate limit bucket like a
+    /scan/ request; when the bucket runs dry the job stops as rate_limited.
+    """
+
+    MAX_ENTRIES = 500
+    MAX_ENTRY_BYTES = 25 * 1024 * 1024
+    IN_FLIGHT_ENTRIES = 8  # Entries buffered between stages - bounds memory
+    JOB_RETENTION_SECONDS = 3600
+
+    def __init__(self):
+        self.scan_concurrency = int(os.getenv("IMPORT_SCAN_CONCURRENCY", "4"))
+        # Shared by every running import, so their Vision calls hold at most
+        # scan_concurrency worker threads (reserved in the executor's thread budget)
+        self._scan_slots = asyncio.Semaphore(self.scan_concurrency)
+        self.process_workers = int(os.getenv("IMPORT_PROCESS_WORKERS", str(os.cpu_count() or 2)))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: dict[str, ImportJob] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.process_workers)
+        return self._executor
+
+    def _prune_jobs(self):
+        cutoff = time.time() - self.JOB_RETENTION_SECONDS
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def get_job(self, job_id: str, user_id: str) -> Optional[ImportJob]:
+        job = self._jobs.get(job_id)
+        return job if job and job.user_id == user_id else None
+
+    @staticmethod
+    def spool_upload(source: BinaryIO) -> BinaryIO:
+        """Copy an upload into a file the import owns (the request's copy is closed when it returns)."""
+        spooled = tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024)
+        while chunk := source.read(1024 * 1024):
+            spooled.write(chunk)
+        spooled.seek(0)
+        return spooled
+
+    def start_import(self, user_id: str, archive: BinaryIO) -> ImportJob:
+        """
+        Validate the archive and start importing it in the background.
+
+        Raises:
+            ValueError: If the file is not a zip or has no images
+        """
+        try:
+            zip_file = zipfile.ZipFile(archive)
+        except zipfile.BadZipFile as e:
+            raise ValueError("File is not a valid zip archive") from e
+
+        entries = [
+            info for info in zip_file.infolist()
+            if not info.is_dir()
+            and not info.filename.startswith("__MACOSX/")
+            and not os.path.basename(info.filename).startswith(".")
+            and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+        if not entries:
+            zip_file.close()
+            raise ValueError("Zip archive contains no images")
+        if len(entries) > self.MAX_ENTRIES:
+            zip_file.close()
+            raise ValueError(f"Zip archive contains more than {self.MAX_ENTRIES} images")
+
+        self._prune_jobs()
+        job = ImportJob(job_id=str(uuid.uuid4()), user_id=user_id, total=len(entries))
+        self._jobs[job.job_id] = job
+        task = asyncio.get_running_loop().create_task(self._run(job, zip_file, entries, archive))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: ImportJob, zip_file: zipfile.ZipFile, entries: list, archive: BinaryIO):
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        in_flight = asyncio.Semaphore(self.IN_FLIGHT_ENTRIES)
+        seen_hashes: set[str] = set()
+        limit_reached = asyncio.Event()
+        rate_limited = asyncio.Event()
+
+        def read_entry(info: zipfile.ZipInfo) -> bytes:
+            if info.file_size > self.MAX_ENTRY_BYTES:
+                raise ValueError("Image too large")
+            with zip_file.open(info) as entry:
+                return entry.read()
+
+        async def process(info: zipfile.ZipInfo, image_data: bytes):
+            try:
+                prepared = await loop.run_in_executor(executor, prepare_image_variants, image_data)
+                del image_data
+                if prepared is None:
+                    raise ValueError("Invalid image file")
+                stored, vision, detected_color = prepared
+
+                digest = hashlib.sha256(stored).hexdigest()
+                if digest in seen_hashes:
+                    job.duplicates += 1
+                    return
+                seen_hashes.add(digest)
+
+                async with self._scan_slots:
+                    if limit_reached.is_set() or rate_limited.is_set():
+                        return
+                    try:
+                        await rate_limiter.check(job.user_id, rate_limiter.cost("POST", "/scan/"))
+                    except RateLimitExceeded as e:
+                        if not rate_limited.is_set():
+                            rate_limited.set()
+                            job.errors.append({
+                                "filename": None,
+                                "error": f"Rate limit reached, retry in {e.result.retry_after}s"
+                            })
+                        return
+                    scan_result = await asyncio.to_thread(
+                        openai_service.scan_clothing_image, vision, user_id=job.user_id
+                    )
+
+                if scan_result.get("color") not in get_args(ColorType):
+                    scan_result["color"] = detected_color
+                metadata = WardrobeItemMetadata(**scan_result)
+
+                if limit_reached.is_set():
+                    return
+
+                file_path = supabase_service.image_path(job.user_id, stored)
+                image_url = await asyncio.to_thread(storage_reclaimer.upload, file_path, stored, "image/jpeg")
+                try:
+                    created = await asyncio.to_thread(
+                        supabase_service.create_wardrobe_item_limited,
+                        job.user_id,
+                        {**metadata.model_dump(), "image_url": image_url}
+                    )
+                except WardrobeLimitError:
+                    limit_reached.set()
+                    storage_reclaimer.enqueue([file_path])
+                    return
+                finally:
+                    storage_reclaimer.unpin([file_path])
+
+                job.created += 1
+                job.item_ids.append(created["id"])
+            except Exception as e:
+                job.failed += 1
+                job.errors.append({"filename": info.filename, "error": str(e)})
+            finally:
+                job.processed += 1
+                in_flight.release()
+
+        tasks = []
+        try:
+            for info in entries:
+                await in_flight.acquire()
+                if limit_reached.is_set() or rate_limited.is_set():
+                    in_flight.release()
+                    break
+                try:
+                    image_data = await asyncio.to_thread(read_entry, info)
+                except Exception as e:
+                    job.failed += 1
+                    job.processed += 1
+                    job.errors.append({"filename": info.filename, "error": str(e)})
+                    in_flight.release()
+                    continue
+                tasks.append(asyncio.create_task(process(info, image_data)))
+
+            await asyncio.gather(*tasks)
+            if limit_reached.is_set():
+                job.status = "limit_reached"
+            elif rate_limited.is_set():
+                job.status = "rate_limited"
+            else:
+                job.status = "completed"
+        except Exception as e:
+            job.status = "failed"
+            job.errors.append({"filename": None, "error": str(e)})
+        finally:
+            zip_file.close()
+            archive.close()
+            job.finished_at = time.time()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+# Singleton instance
+import_service = ImportService()
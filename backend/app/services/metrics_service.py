@@ -0,0 +1,151 @@
+import time
+import bisect
+import threading
+import functools
+from contextlib import contextmanager
+
+class Histogram:
+    """Prometheus-style cumulative histogram with one label set per series."""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...], buckets: tuple[float, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # label values -> [bucket counts..., +Inf count], sum
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.setdefault(label_values, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total[0]) for labels, (counts, total) in self._series.items()}
+        for label_values, (counts, total) in sorted(series.items()):
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, label_values))
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+class Counter:
+    """Prometheus-style monotonic counter with one label set per series."""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._series: dict[tuple[str, ...], int] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: int = 1):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            series = dict(self._series)
+        for label_values, count in sorted(series.items()):
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, label_values))
+            lines.append(f"{self.name}{{{labels}}} {count}")
+        return lines
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class MetricsService:
+    """
+    In-process latency metrics, exported in Prometheus text format on /metrics.
+
+    - http_request_duration_seconds: per route, recorded by MetricsMiddleware
+    - upstream_call_duration_seconds: Supabase and OpenAI calls
+    - image_processing_duration_seconds: compression and local image analysis
+    - upstream_calls_coalesced_total: calls served by an identical in-flight call
+    - admission_rejections_total: requests turned away by admission control
+    - rate_limit_rejections_total: requests refused by the per-user rate limiter
+    """
+
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self):
+        self.http_requests = Histogram(
+            "http_request_duration_seconds", "HTTP request latency by route",
+            ("method", "route", "status"), self.LATENCY_BUCKETS
+        )
+        self.upstream_calls = Histogram(
+            "upstream_call_duration_seconds", "Latency of calls to Supabase and OpenAI",
+            ("call", "outcome"), self.LATENCY_BUCKETS
+        )
+        self.image_processing = Histogram(
+            "image_processing_duration_seconds", "Image processing time by operation",
+            ("operation",), self.LATENCY_BUCKETS
+        )
+        self.coalesced_calls = Counter(
+            "upstream_calls_coalesced_total", "Upstream calls served by joining an identical in-flight call",
+            ("call",)
+        )
+        self.admission_rejections = Counter(
+            "admission_rejections_total", "Requests rejected with 503 by admission control",
+            ("pool", "reason")
+        )
+        self.rate_limit_rejections = Counter(
+            "rate_limit_rejections_total", "Requests rejected with 429 by the per-user rate limiter, by cost",
+            ("cost",)
+        )
+
+    @contextmanager
+    def span(self, histogram: Histogram, name: str):
+        """Time a block into histogram; upstream spans also record success/error."""
+        start = time.perf_counter()
+        outcome = "success"
+        try:
+            yield
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            if histogram is self.upstream_calls:
+                histogram.observe(elapsed, name, outcome)
+            else:
+                histogram.observe(elapsed, name)
+
+    def upstream(self, name: str):
+        """Decorator timing an upstream call."""
+        return self._decorator(self.upstream_calls, name)
+
+    def image(self, name: str):
+        """Decorator timing an image processing step."""
+        return self._decorator(self.image_processing, name)
+
+    def _decorator(self, histogram: Histogram, name: str):
+        def wrap(func):
+            @functools.wraps(func)
+            def timed(*args, **kwargs):
+                with self.span(histogram, name):
+                    return func(*args, **kwargs)
+            return timed
+        return wrap
+
+    def render(self) -> str:
+        lines = []
+        for metric in (self.http_requests, self.upstream_calls, self.image_processing, self.coalesced_calls,
+                       self.admission_rejections, self.rate_limit_rejections):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Singleton instance
+metrics_service = MetricsService()
@@ -1,30 +1,64 @@
 import os
 import json
+import time
 import base64
-from openai import OpenAI
-from dotenv import load_dotenv
-from app.prompts import SCANNER_VISION_PROMPT, STYLIST_SYSTEM_PROMPT, format_wardrobe_context
+import threading
+from io import BytesIO
+from typing import Iterator, Optional, TYPE_CHECKING
+from app.services.metrics_service import metrics_service
+from app.services.usage_service import usage_service
+from app.prompts import SCANNER_VISION_PROMPT, STYLIST_SYSTEM_PROMPT, format_wardrobe_context, format_outfit_candidates
 
-load_dotenv()
+if TYPE_CHECKING:
+    from openai import OpenAI
 
 class OpenAIService:
     def __init__(self):
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("Missing OPENAI_API_KEY environment variable")
-
-        self.client = OpenAI(api_key=api_key)
+        self._client: Optional["OpenAI"] = None
+        self._client_lock = threading.Lock()
         self.vision_model = "gpt-4o"
         self.chat_model = "gpt-4o"
-
-    def scan_clothing_image(self, image_data: bytes) -> dict:
+        # "low" bills a fixed small token count per image; "high"/"auto" tile the image
+        self.vision_detail = os.getenv("OPENAI_VISION_DETAIL", "low")
+
+    @property
+    def client(self) -> "OpenAI":
+        """The OpenAI client, created on first use (the SDK is slow to import)."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    api_key = os.getenv("OPENAI_API_KEY")
+                    if not api_key:
+                        raise ValueError("Missing OPENAI_API_KEY environment variable")
+
+                    from openai import OpenAI
+                    self._client = OpenAI(api_key=api_key)
+        return self._client
+
+    def warm_up(self):
+        """Create the client and open a connection to the API (free, no tokens)."""
+        self.client.with_options(max_retries=0).models.retrieve(self.chat_model)
+
+    @staticmethod
+    def _image_data_url(image_data: bytes) -> str:
+        """Encode JPEG bytes as a data URL in a single base64 pass."""
+        return "data:image/jpeg;base64," + base64.b64encode(image_data).decode('ascii')
+
+    @metrics_service.upstream("scan_clothing_image")
+    def scan_clothing_image(self, image_data: bytes, detail: Optional[str] = None,
+                            user_id: Optional[str] = None) -> dict:
         """
         Use GPT-4o Vision to analyze a clothing image and extract metadata.
 
+        Args:
+            image_data: Vision-input JPEG bytes (see ImageService.compress_for_vision)
+            detail: Vision detail level, defaults to OPENAI_VISION_DETAIL
+            user_id: User the call is billed to in usage accounting
+
         Returns a dict with: title, description, color, warmth, formality
         """
-        # Encode image to base64
-        base64_image = base64.b64encode(image_data).decode('utf-8')
+        detail = detail or self.vision_detail
+        start = time.perf_counter()
 
         response = self.client.chat.completions.create(
             model=self.vision_model,
@@ -39,7 +73,8 @@ class OpenAIService:
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
+                                "url": self._image_data_url(image_data),
+                                "detail": detail
                             }
                         }
                     ]
@@ -49,6 +84,13 @@ class OpenAIService:
             temperature=0.3,  # Lower temperature for more consistent output
         )
 
+        from PIL import Image
+        width, height = Image.open(BytesIO(image_data)).size
+        usage_service.record(
+            user_id, "scan", self.vision_model, response.usage, time.perf_counter() - start,
+            image_tokens=usage_service.estimate_image_tokens(detail, width, height)
+        )
+
         # Parse the JSON response
         content = response.choices[0].message.content
 
@@ -64,7 +106,10 @@ class OpenAIService:
         except json.JSONDecodeError as e:
             raise ValueError(f"Failed to parse AI response as JSON: {content}") from e
 
-    def chat_with_stylist(self, user_message: str, chat_history: list, wardrobe_items: list) -> str:
+    @metrics_service.upstream("chat_with_stylist")
+    def chat_with_stylist(self, user_message: str, chat_history: list, wardrobe_items: list,
+                          candidate_outfits: Optional[list] = None, user_id: Optional[str] = None,
+                          occasion: Optional[str] = None) -> str:
         """
         Chat with the AI stylist, providing wardrobe context.
 
@@ -72,15 +117,68 @@ class OpenAIService:
             user_message: The user's current message
             chat_history: List of previous messages [{role: "user"/"assistant", content: "..."}]
             wardrobe_items: List of user's wardrobe items
+            candidate_outfits: Optional pre-ranked outfits from OutfitService
+            user_id: User the call is billed to in usage accounting
+            occasion: What candidate_outfits were ranked for; wardrobe_items is then
+                      only the relevant part of the wardrobe (see OutfitIndex)
 
         Returns:
             The AI stylist's response
         """
+        messages = self._stylist_messages(user_message, chat_history, wardrobe_items, candidate_outfits, occasion)
+
+        # Call OpenAI API
+        start = time.perf_counter()
+        response = self.client.chat.completions.create(
+            model=self.chat_model,
+            messages=messages,
+            max_tokens=1000,
+            temperature=0.7,  # Balanced creativity for styling advice
+        )
+        usage_service.record(user_id, "chat", self.chat_model, response.usage, time.perf_counter() - start)
+
+        return response.choices[0].message.content
+
+    def stream_chat_with_stylist(self, user_message: str, chat_history: list, wardrobe_items: list,
+                                 candidate_outfits: Optional[list] = None,
+                                 user_id: Optional[str] = None, occasion: Optional[str] = None) -> Iterator[str]:
+        """
+        Like chat_with_stylist, but yields the response text as it is generated.
+
+        Closing the generator early closes the upstream stream.
+        """
+        messages = self._stylist_messages(user_message, chat_history, wardrobe_items, candidate_outfits, occasion)
+
+        start = time.perf_counter()
+        usage = None
+        with metrics_service.span(metrics_service.upstream_calls, "stream_chat_with_stylist"):
+            stream = self.client.chat.completions.create(
+                model=self.chat_model,
+                messages=messages,
+                max_tokens=1000,
+                temperature=0.7,
+                stream=True,
+                stream_options={"include_usage": True},  # Usage arrives in a final chunk with no choices
+            )
+            try:
+                with stream:
+                    for chunk in stream:
+                        if chunk.usage is not None:
+                            usage = chunk.usage
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            yield chunk.choices[0].delta.content
+            finally:
+                # Also when the client went away mid-stream (usage is then unknown)
+                usage_service.record(user_id, "chat", self.chat_model, usage, time.perf_counter() - start)
+
+    @staticmethod
+    def _stylist_messages(user_message: str, chat_history: list, wardrobe_items: list,
+                          candidate_outfits: Optional[list], occasion: Optional[str] = None) -> list[dict]:
         # Format wardrobe context
-        wardrobe_context = format_wardrobe_context(wardrobe_items)
+        wardrobe_context = format_wardrobe_context(wardrobe_items, focused=occasion is not None)
 
         # Build system message with wardrobe context
-        system_message = STYLIST_SYSTEM_PROMPT + wardrobe_context
+        system_message = STYLIST_SYSTEM_PROMPT + wardrobe_context + format_outfit_candidates(candidate_outfits or [], occasion)
 
         # Build messages array
         messages = [{"role": "system", "content": system_message}]
@@ -91,16 +189,7 @@ class OpenAIService:
 
         # Add current user message
         messages.append({"role": "user", "content": user_message})
-
-        # Call OpenAI API
-        response = self.client.chat.completions.create(
-            model=self.chat_model,
-            messages=messages,
-            max_tokens=1000,
-            temperature=0.7,  # Balanced creativity for styling advice
-        )
-
-        return response.choices[0].message.content
+        return messages
 
 # Singleton instance
 openai_service = OpenAIService()
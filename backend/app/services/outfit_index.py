@@ -0,0 +1,135 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+from app.services.outfit_service import outfit_service, OutfitCombinations
+
+@dataclass
+class UserOutfitIndex:
+    # item id -> (fields the ranking reads, slot or None)
+    items: dict[str, tuple[tuple, Optional[str]]] = field(default_factory=dict)
+    combinations: Optional[OutfitCombinations] = None
+    # (warmth or None, band or None) -> ranked outfits, filled on first lookup
+    buckets: dict[tuple[Optional[str], Optional[str]], list[dict]] = field(default_factory=dict)
+
+class OutfitIndex:
+    """
+    Per-user precomputed outfit candidates, bucketed by warmth (WarmthType)
+    and formality band.
+
+    The request-independent part of scoring every top/bottom/outer
+    combination is kept per user and only rebuilt when an item that affects
+    it changes; unchanged items are not re-categorized. Each bucket is
+    ranked once from it and reused until the wardrobe changes.
+
+    parse_request() maps a chat message such as "it's cold and I have a
+    meeting" to a bucket, so the stylist gets a small matching candidate set.
+    """
+
+    FORMALITY_BANDS = {"casual": (1, 3), "smart": (4, 6), "formal": (7, 10)}
+
+    # Checked in order; the first group with a matching keyword wins
+    WARMTH_KEYWORDS = {
+        "Cold": ["cold", "freezing", "snow", "snowy", "icy", "frigid", "winter"],
+        "Hot": ["hot", "heatwave", "heat wave", "scorching", "humid", "summer"],
+        "Cool": ["chilly", "cool out", "cool outside", "cool weather", "brisk", "crisp", "autumn", "rainy", "windy"],
+        "Warm": ["warm", "sunny"],
+        "Neutral": ["mild", "spring", "temperate"],
+    }
+    FORMALITY_KEYWORDS = {
+        "formal": ["formal", "wedding", "gala", "interview", "black tie", "funeral", "ceremony"],
+        "smart": ["smart casual", "meeting", "office", "at work", "business", "presentation", "conference", "date", "dinner"],
+        "casual": ["casual", "weekend", "gym", "hike", "hiking", "errands", "brunch", "picnic", "beach", "lounging"],
+    }
+
+    def __init__(self):
+        self.max_users = int(os.getenv("OUTFIT_INDEX_MAX_USERS", "1000"))
+        self.bucket_size = int(os.getenv("OUTFIT_INDEX_BUCKET_SIZE", "5"))
+        self._users: OrderedDict[str, UserOutfitIndex] = OrderedDict()
+        self._lock = threading.Lock()
+        self._warmth_patterns = self._compile(self.WARMTH_KEYWORDS)
+        self._formality_patterns = self._compile(self.FORMALITY_KEYWORDS)
+
+    @staticmethod
+    def _compile(groups: dict[str, list[str]]) -> list[tuple[str, re.Pattern]]:
+        return [
+            (name, re.compile(r"\b(" + "|".join(re.escape(k) for k in keywords) + r")\b", re.IGNORECASE))
+            for name, keywords in groups.items()
+        ]
+
+    def parse_request(self, message: str) -> tuple[Optional[str], Optional[str]]:
+        """Return (WarmthType or None, formality band or None) mentioned in a message."""
+        warmth = next((name for name, pattern in self._warmth_patterns if pattern.search(message)), None)
+        band = next((name for name, pattern in self._formality_patterns if pattern.search(message)), None)
+        return warmth, band
+
+    @staticmethod
+    def _ranking_fields(item: dict) -> tuple:
+        return (item.get("title"), item.get("description"), item.get("color"), item.get("warmth"),
+                item.get("formality"), item.get("image_url"))
+
+    def _sync(self, user_id: str, wardrobe_items: list) -> UserOutfitIndex:
+        index = self._users.get(user_id)
+        is_new = index is None
+        if is_new:
+            index = self._users[user_id] = UserOutfitIndex()
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user_id)
+
+        current = {item["id"]: item for item in wardrobe_items}
+        changed = is_new or current.keys() != index.items.keys()
+        for item_id, item in current.items():
+            fields = self._ranking_fields(item)
+            known = index.items.get(item_id)
+            if known is None or known[0] != fields:
+                index.items[item_id] = (fields, outfit_service.categorize(item))
+                changed = True
+        for item_id in index.items.keys() - current.keys():
+            del index.items[item_id]
+
+        if changed:
+            slots = {"top": [], "bottom": [], "outer": []}
+            for item_id, item in current.items():
+                slot = index.items[item_id][1]
+                if slot:
+                    slots[slot].append(item)
+            index.combinations = outfit_service.combinations(slots)
+            index.buckets.clear()
+        return index
+
+    def candidates(self, user_id: str, wardrobe_items: list, warmth: Optional[str] = None,
+                   band: Optional[str] = None, limit: Optional[int] = None) -> list[dict]:
+        """
+        Best outfits for a warmth and formality band, from the user's index.
+
+        wardrobe_items is the user's current wardrobe; any difference from
+        the indexed copy is applied first.
+        """
+        with self._lock:
+            index = self._sync(user_id, wardrobe_items)
+            key = (warmth, band)
+            if key not in index.buckets:
+                formality_min, formality_max = self.FORMALITY_BANDS.get(band, (None, None))
+                index.buckets[key] = outfit_service.rank_combinations(
+                    index.combinations, warmth, formality_min, formality_max, self.bucket_size
+                )
+            outfits = index.buckets[key]
+        return outfits[:limit] if limit else outfits
+
+    def focused_wardrobe(self, user_id: str, wardrobe_items: list, outfits: list[dict]) -> list:
+        """
+        The part of the wardrobe worth showing the stylist for these outfits:
+        their pieces plus items outside the outfit slots (shoes, accessories).
+        Call after candidates() for the same wardrobe.
+        """
+        in_outfits = {piece["id"] for outfit in outfits for piece in (outfit["top"], outfit["bottom"], outfit["outer"]) if piece}
+        with self._lock:
+            index = self._users.get(user_id)
+            slots = {item_id: slot for item_id, (_, slot) in index.items.items()} if index else {}
+        return [item for item in wardrobe_items if item["id"] in in_outfits or slots.get(item["id"]) is None]
+
+# Singleton instance
+outfit_index = OutfitIndex()
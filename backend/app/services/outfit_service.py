@@ -0,0 +1,214 @@
+import re
+import numpy as np
+from dataclasses import dataclass
+from typing import Optional
+
+@dataclass
+class OutfitCombinations:
+    """Request-independent scores of every top x bottom x (outer or none) combination."""
+    tops: list
+    bottoms: list
+    outers: list
+    has_outer: np.ndarray
+    color_score: np.ndarray
+    outfit_warmth: np.ndarray
+    warmth_gap: np.ndarray
+    formality_mean: np.ndarray
+    formality_spread: np.ndarray
+
+class OutfitService:
+    """
+    Deterministic outfit recommender.
+
+    Wardrobe items are encoded into NumPy arrays and every top/bottom/outer
+    combination is scored in one vectorized pass for color harmony, warmth
+    and formality.
+    """
+
+    COLORS = ["Black", "White", "Gray", "Blue", "Brown", "Green", "Red", "Pink", "Yellow", "Purple", "Orange"]
+    WARMTHS = ["Cold", "Cool", "Neutral", "Warm", "Hot"]
+
+    # Colors that go with anything; Blue is included for denim
+    NEUTRAL_COLORS = {"Black", "White", "Gray", "Brown", "Blue"}
+    COMPLEMENTARY_COLORS = [("Blue", "Orange"), ("Red", "Green"), ("Yellow", "Purple"), ("Pink", "Green")]
+    ANALOGOUS_COLORS = [
+        ("Red", "Orange"), ("Orange", "Yellow"), ("Yellow", "Green"), ("Green", "Blue"),
+        ("Blue", "Purple"), ("Purple", "Pink"), ("Pink", "Red"),
+    ]
+
+    # Keywords used to place an item in an outfit slot (checked against title then description)
+    CATEGORY_KEYWORDS = {
+        "outer": ["jacket", "coat", "blazer", "parka", "trench", "windbreaker", "puffer", "overcoat", "anorak", "cardigan", "gilet"],
+        "bottom": ["jeans", "pants", "trousers", "shorts", "skirt", "chinos", "joggers", "leggings", "slacks", "sweatpants", "cargos"],
+        "top": ["shirt", "t-shirt", "tee", "blouse", "sweater", "hoodie", "polo", "top", "tank", "sweatshirt", "jumper", "pullover", "turtleneck", "henley", "camisole"],
+    }
+
+    # Score weights
+    COLOR_WEIGHT = 1.0
+    WARMTH_WEIGHT = 1.0
+    FORMALITY_WEIGHT = 1.0
+
+    def __init__(self):
+        n = len(self.COLORS)
+        index = {color: i for i, color in enumerate(self.COLORS)}
+        harmony = np.full((n, n), 0.3, dtype=np.float32)
+        for a, b in self.ANALOGOUS_COLORS:
+            harmony[index[a], index[b]] = harmony[index[b], index[a]] = 0.8
+        for a, b in self.COMPLEMENTARY_COLORS:
+            harmony[index[a], index[b]] = harmony[index[b], index[a]] = 0.7
+        np.fill_diagonal(harmony, 0.6)
+        for color in self.NEUTRAL_COLORS:
+            harmony[index[color], :] = 1.0
+            harmony[:, index[color]] = 1.0
+        self.color_harmony = harmony
+        self._color_index = index
+        self._warmth_index = {warmth: i for i, warmth in enumerate(self.WARMTHS)}
+        self._keyword_patterns = {
+            category: re.compile(r"\b(" + "|".join(re.escape(k) for k in keywords) + r")s?\b", re.IGNORECASE)
+            for category, keywords in self.CATEGORY_KEYWORDS.items()
+        }
+
+    def categorize(self, item: dict) -> Optional[str]:
+        """Return "top", "bottom" or "outer" for an item, or None (shoes, accessories, ...)."""
+        for text in (item.get("title", ""), item.get("description", "")):
+            for category, pattern in self._keyword_patterns.items():
+                if pattern.search(text or ""):
+                    return category
+        return None
+
+    def _encode(self, items: list) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Encode items into (color index, warmth index, formality) arrays."""
+        colors = np.array([self._color_index.get(item["color"], 0) for item in items], dtype=np.intp)
+        warmths = np.array([self._warmth_index.get(item["warmth"], 2) for item in items], dtype=np.float32)
+        formalities = np.array([item["formality"] for item in items], dtype=np.float32)
+        return colors, warmths, formalities
+
+    def recommend(self, wardrobe_items: list, warmth: Optional[str] = None,
+                  formality_min: Optional[int] = None, formality_max: Optional[int] = None,
+                  limit: int = 5) -> list[dict]:
+        """
+        Rank outfit combinations from the wardrobe.
+
+        Args:
+            wardrobe_items: User's wardrobe item rows
+            warmth: Target WarmthType for the weather, or None for no target
+            formality_min: Lower bound of the desired formality band
+            formality_max: Upper bound of the desired formality band
+            limit: Maximum number of outfits to return
+
+        Returns:
+            List of {"top", "bottom", "outer", "score"} dicts, best first.
+            "outer" is None when the outfit has no outer layer.
+        """
+        return self.rank(self.slot_items(wardrobe_items), warmth, formality_min, formality_max, limit)
+
+    def slot_items(self, wardrobe_items: list) -> dict[str, list]:
+        """Group items by outfit slot ("top", "bottom", "outer"); uncategorized items are left out."""
+        slots = {"top": [], "bottom": [], "outer": []}
+        for item in wardrobe_items:
+            category = self.categorize(item)
+            if category:
+                slots[category].append(item)
+        return slots
+
+    def rank(self, slots: dict[str, list], warmth: Optional[str] = None,
+             formality_min: Optional[int] = None, formality_max: Optional[int] = None,
+             limit: int = 5) -> list[dict]:
+        """recommend() for items already grouped by slot_items()."""
+        return self.rank_combinations(self.combinations(slots), warmth, formality_min, formality_max, limit)
+
+    def combinations(self, slots: dict[str, list]) -> Optional[OutfitCombinations]:
+        """Score every combination on what does not depend on the request; None if no outfit is possible."""
+        tops, bottoms, outers = slots["top"], slots["bottom"], slots["outer"]
+        if not tops or not bottoms:
+            return None
+
+        t_color, t_warmth, t_formality = self._encode(tops)
+        b_color, b_warmth, b_formality = self._encode(bottoms)
+        o_color, o_warmth, o_formality = self._encode(outers) if outers else (
+            np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32))
+
+        # Axes: [top, bottom, outer]; the last outer slot means "no outer layer"
+        n_outer = len(outers) + 1
+        has_outer = np.arange(n_outer) < len(outers)
+        o_color = np.append(o_color, 0)
+        o_warmth = np.append(o_warmth, 0).astype(np.float32)
+        o_formality = np.append(o_formality, 0).astype(np.float32)
+
+        # Color harmony: mean of pairwise harmony over worn pieces
+        top_bottom = self.color_harmony[t_color[:, None], b_color[None, :]][:, :, None]
+        top_outer = self.color_harmony[t_color[:, None], o_color[None, :]][:, None, :]
+        bottom_outer = self.color_harmony[b_color[:, None], o_color[None, :]][None, :, :]
+        color_score = np.where(
+            has_outer[None, None, :],
+            (top_bottom + top_outer + bottom_outer) / 3,
+            top_bottom,
+        )
+
+        # Warmth: lower index is heavier; an outer layer counts extra
+        piece_count = np.where(has_outer, 3.5, 2.0)[None, None, :]
+        warmth_sum = t_warmth[:, None, None] + b_warmth[None, :, None] + 1.5 * o_warmth[None, None, :] * has_outer[None, None, :]
+        outfit_warmth = warmth_sum / piece_count - 0.5 * has_outer[None, None, :]
+        # Used without a target: prefer pieces suited to the same weather
+        warmth_gap = np.abs(t_warmth[:, None, None] - b_warmth[None, :, None])
+
+        # Formality: mean and spread between pieces
+        f_top = np.broadcast_to(t_formality[:, None, None], color_score.shape)
+        f_bottom = np.broadcast_to(b_formality[None, :, None], color_score.shape)
+        f_outer = np.where(has_outer[None, None, :], o_formality[None, None, :], f_top)
+        f_high = np.maximum(np.maximum(f_top, f_bottom), f_outer)
+        f_low = np.minimum(np.minimum(f_top, f_bottom), f_outer)
+        f_mean = np.where(has_outer[None, None, :], (f_top + f_bottom + f_outer) / 3, (f_top + f_bottom) / 2)
+
+        return OutfitCombinations(
+            tops=tops, bottoms=bottoms, outers=outers, has_outer=has_outer[None, None, :],
+            color_score=color_score, outfit_warmth=outfit_warmth, warmth_gap=warmth_gap,
+            formality_mean=f_mean, formality_spread=f_high - f_low,
+        )
+
+    def rank_combinations(self, combos: Optional[OutfitCombinations], warmth: Optional[str] = None,
+                          formality_min: Optional[int] = None, formality_max: Optional[int] = None,
+                          limit: int = 5) -> list[dict]:
+        """Score precomputed combinations for a target warmth and formality band; best first."""
+        if combos is None or limit <= 0:
+            return []
+
+        if warmth in self._warmth_index:
+            target = self._warmth_index[warmth]
+            warmth_score = 1.0 - np.abs(combos.outfit_warmth - target) / (len(self.WARMTHS) - 1)
+        else:
+            warmth_score = 1.0 - combos.warmth_gap / (len(self.WARMTHS) - 1)
+            # Outer layers only make sense without a target when it's cool out
+            warmth_score = warmth_score - 0.1 * combos.has_outer
+
+        # Formality: distance from the requested band plus spread between pieces
+        band_low = formality_min if formality_min is not None else 1
+        band_high = formality_max if formality_max is not None else 10
+        f_mean = combos.formality_mean
+        band_miss = np.maximum(band_low - f_mean, 0) + np.maximum(f_mean - band_high, 0)
+        formality_score = 1.0 - (band_miss + 0.5 * combos.formality_spread) / 9
+
+        total = (
+            self.COLOR_WEIGHT * combos.color_score
+            + self.WARMTH_WEIGHT * warmth_score
+            + self.FORMALITY_WEIGHT * formality_score
+        ).ravel()
+
+        limit = min(limit, total.size)
+        best = np.argpartition(-total, limit - 1)[:limit]
+        best = best[np.argsort(-total[best], kind="stable")]
+
+        tops, bottoms, outers = combos.tops, combos.bottoms, combos.outers
+        outfits = []
+        for flat_index in best:
+            t, b, o = np.unravel_index(flat_index, (len(tops), len(bottoms), len(outers) + 1))
+            outfits.append({
+                "top": tops[t],
+                "bottom": bottoms[b],
+                "outer": outers[o] if o < len(outers) else None,
+                "score": round(float(total[flat_index]), 4),
+            })
+        return outfits
+
+# Singleton instance
+outfit_service = OutfitService()
@@ -0,0 +1,234 @@
+import os
+import math
+import hashlib
+import time
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+from app.services.metrics_service import metrics_service
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: int  # Seconds until the bucket is full again
+    retry_after: int  # Seconds until this request's cost is available (0 if allowed)
+
+@dataclass
+class RateLimitContext:
+    """Per-request state shared between RateLimitMiddleware and the route's auth check."""
+    cost: int
+    token: Optional[str] = None  # Bearer token, if any, to recognize users seen before
+    result: Optional[RateLimitResult] = None
+
+# Set by RateLimitMiddleware for each HTTP request
+rate_limit_context: ContextVar[Optional[RateLimitContext]] = ContextVar("rate_limit_context", default=None)
+
+class RateLimitExceeded(Exception):
+    """The user's bucket does not hold enough tokens; answered with 429 and Retry-After."""
+
+    def __init__(self, result: RateLimitResult):
+        super().__init__("Rate limit exceeded")
+        self.result = result
+
+class BucketStore(ABC):
+    """
+    Where token buckets live. take() refills the bucket for the time since
+    its last use, removes cost tokens if there are enough, and returns
+    (allowed, tokens left). Subclass this to share buckets between nodes.
+    """
+
+    @abstractmethod
+    async def take(self, key: str, cost: float, capacity: float, refill_per_second: float) -> tuple[bool, float]:
+        ...
+
+    def peek(self, key: str, capacity: float, refill_per_second: float) -> Optional[float]:
+        """Tokens in a bucket right now without taking any, or None if that is not known cheaply."""
+        return None
+
+class MemoryBucketStore(BucketStore):
+    """Node-local buckets; the least recently used are dropped beyond max_keys (they are usually full)."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        # key -> [tokens, monotonic time of last update]
+        self._buckets: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, cost: float, capacity: float, refill_per_second: float) -> tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [capacity, now]
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(key)
+
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * refill_per_second)
+            bucket[1] = now
+            allowed = bucket[0] >= cost
+            if allowed:
+                bucket[0] -= cost
+            return allowed, bucket[0]
+
+    def peek(self, key: str, capacity: float, refill_per_second: float) -> Optional[float]:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                return capacity
+            return min(capacity, bucket[0] + (time.monotonic() - bucket[1]) * refill_per_second)
+
+class SupabaseBucketStore(BucketStore):
+    """Buckets in Postgres (take_rate_limit_tokens in supabase_setup.sql), shared by every node."""
+
+    async def take(self, key: str, cost: float, capacity: float, refill_per_second: float) -> tuple[bool, float]:
+        from app.services.supabase_service import supabase_service
+        return await asyncio.to_thread(supabase_service.take_rate_limit_tokens, key, cost, capacity, refill_per_second)
+
+class RateLimiter:
+    """
+    Per-user token bucket rate limiting.
+
+    Each user has a bucket of RATE_LIMIT_CAPACITY tokens refilled at
+    RATE_LIMIT_REFILL_PER_SECOND. A request costs tokens by route: model
+    calls (/scan/, /chat/, /chat/ws turns and each entry of a zip import)
+    are expensive, reads cheap.
+    Routes check the bucket once their auth helper has resolved the user;
+    responses carry RateLimit-Limit/Remaining/Reset, and a request without
+    enough tokens gets 429 with Retry-After.
+
+    Routes run inside admission control, so a request is normally charged
+    after it has taken an admission slot and verified its token. To keep a
+    throttled client from using slots and auth calls, tokens that passed
+    auth are remembered per node, and RateLimitMiddleware (which wraps
+    admission) refuses a known user's request up front when their bucket
+    cannot cover it. That needs a cheap peek, so it only applies to the
+    in-memory store.
+
+    Buckets are in memory (per node) unless RATE_LIMIT_BACKEND=supabase. A
+    failing shared store lets requests through rather than failing them.
+    """
+
+    ROUTE_COSTS = {
+        ("POST", "/scan/"): 10,
+        ("POST", "/chat/"): 5,
+        ("POST", "/scan/color/"): 2,
+        ("POST", "/wardrobe/import/"): 10,
+        ("POST", "/wardrobe/bulk/create/"): 5,
+    }
+    READ_COST = 1
+    WRITE_COST = 2
+
+    def __init__(self):
+        self.enabled = os.getenv("RATE_LIMIT", "true").lower() == "true"
+        self.capacity = float(os.getenv("RATE_LIMIT_CAPACITY", "60"))
+        self.refill_per_second = float(os.getenv("RATE_LIMIT_REFILL_PER_SECOND", "1"))
+        if os.getenv("RATE_LIMIT_BACKEND", "memory").lower() == "supabase":
+            self.backend: BucketStore = SupabaseBucketStore()
+        else:
+            self.backend = MemoryBucketStore(int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000")))
+        self.max_known_tokens = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+        # sha256 of a bearer token that passed auth -> user id
+        self._token_users: OrderedDict[str, str] = OrderedDict()
+        self._token_lock = threading.Lock()
+
+    def cost(self, method: str, path: str) -> int:
+        """Tokens a request to this route takes."""
+        # Routes are registered with a trailing slash; accept the request either way
+        cost = self.ROUTE_COSTS.get((method, path.rstrip("/") + "/"))
+        if cost is not None:
+            return cost
+        return self.READ_COST if method in ("GET", "HEAD") else self.WRITE_COST
+
+    async def check(self, user_id: str, cost: int) -> RateLimitResult:
+        """Take cost tokens from the user's bucket; raises RateLimitExceeded if there are not enough."""
+        if not self.enabled:
+            return RateLimitResult(True, int(self.capacity), int(self.capacity), 0, 0)
+        try:
+            allowed, tokens = await self.backend.take(user_id, cost, self.capacity, self.refill_per_second)
+        except Exception as e:
+            logger.warning("Rate limit store failed, allowing request", extra={"user_id": user_id, "error": str(e)})
+            allowed, tokens = True, self.capacity
+
+        result = RateLimitResult(
+            allowed=allowed,
+            limit=int(self.capacity),
+            remaining=int(tokens),
+            reset_after=math.ceil((self.capacity - tokens) / self.refill_per_second),
+            retry_after=0 if allowed else max(1, math.ceil((cost - tokens) / self.refill_per_second)),
+        )
+        if not allowed:
+            metrics_service.rate_limit_rejections.inc(str(cost))
+            raise RateLimitExceeded(result)
+        return result
+
+    @staticmethod
+    def _token_key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def _remember(self, token: str, user_id: str):
+        key = self._token_key(token)
+        with self._token_lock:
+            self._token_users[key] = user_id
+            self._token_users.move_to_end(key)
+            while len(self._token_users) > self.max_known_tokens:
+                self._token_users.popitem(last=False)
+
+    def precheck(self, context: RateLimitContext) -> Optional[RateLimitResult]:
+        """
+        Refusal for a request from a known user whose bucket cannot cover its
+        cost, decided without auth or an admission slot; None to go ahead.
+        """
+        if not context.token:
+            return None
+        with self._token_lock:
+            user_id = self._token_users.get(self._token_key(context.token))
+        if user_id is None:
+            return None
+        tokens = self.backend.peek(user_id, self.capacity, self.refill_per_second)
+        if tokens is None or tokens >= context.cost:
+            return None
+        metrics_service.rate_limit_rejections.inc(str(context.cost))
+        return RateLimitResult(
+            allowed=False,
+            limit=int(self.capacity),
+            remaining=int(tokens),
+            reset_after=math.ceil((self.capacity - tokens) / self.refill_per_second),
+            retry_after=max(1, math.ceil((context.cost - tokens) / self.refill_per_second)),
+        )
+
+    async def enforce(self, user_id: str):
+        """Charge the current HTTP request to the user (no-op outside RateLimitMiddleware)."""
+        context = rate_limit_context.get()
+        if not self.enabled or context is None or context.result is not None:
+            return
+        if context.token:
+            self._remember(context.token, user_id)
+        try:
+            context.result = await self.check(user_id, context.cost)
+        except RateLimitExceeded as e:
+            context.result = e.result
+            raise
+
+    @staticmethod
+    def headers(result: RateLimitResult) -> dict[str, str]:
+        headers = {
+            "RateLimit-Limit": str(result.limit),
+            "RateLimit-Remaining": str(result.remaining),
+            "RateLimit-Reset": str(result.reset_after),
+        }
+        if not result.allowed:
+            headers["Retry-After"] = str(result.retry_after)
+        return headers
+
+# Singleton instance
+rate_limiter = RateLimiter()
@@ -0,0 +1,148 @@
+import os
+import time
+import asyncio
+import logging
+import secrets
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+from app.services.supabase_service import supabase_service
+from app.services.image_service import image_service
+from app.services.storage_reclaimer import storage_reclaimer
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class PrefetchedImage:
+    user_id: str
+    upload: Optional[asyncio.Task] = None  # Resolves to (file_path, public URL); the path stays pinned
+    created: float = field(default_factory=time.monotonic)
+
+class ScanPrefetchService:
+    """
+    Speculative image upload between /scan and the confirming POST /wardrobe.
+
+    /scan decodes the image once, compresses and stores it while the model
+    looks at the vision-size copy, and hands the client a scan token.
+    Creating the item with that token only awaits the (usually finished)
+    upload and inserts the row, so the image is sent and compressed once.
+
+    The upload stays pinned in the storage reclaimer until it is claimed
+    (the claimer unpins it after its insert) or discarded. Tokens are
+    node-local and expire after SCAN_PREFETCH_TTL_SECONDS. Uploads that are
+    never claimed go to the storage reclaimer. If a token is
+    unknown (expired, or issued by another node) the client sends the file
+    instead.
+    """
+
+    def __init__(self):
+        self.ttl = float(os.getenv("SCAN_PREFETCH_TTL_SECONDS", "900"))
+        # Oldest unclaimed scans beyond this are dropped, so one user cannot pile up uploads
+        self.max_per_user = int(os.getenv("SCAN_PREFETCH_MAX_PER_USER", "10"))
+        self._entries: dict[str, PrefetchedImage] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def stash(self, user_id: str, image_data: bytes) -> tuple[str, bytes]:
+        """
+        Start compressing and uploading an original image in the background.
+
+        The image is decoded once for both variants. Returns (scan token,
+        vision-model image) as soon as the vision image is ready; the stored
+        copy is compressed and uploaded after that.
+        """
+        loop = asyncio.get_running_loop()
+        vision = loop.create_future()
+
+        def vision_ready(vision_image: bytes):
+            loop.call_soon_threadsafe(lambda: vision.done() or vision.set_result(vision_image))
+
+        entry = PrefetchedImage(user_id)
+        entry.upload = loop.create_task(asyncio.to_thread(self._store, entry, image_data, vision_ready))
+        token = secrets.token_urlsafe(24)
+        self._entries[token] = entry
+
+        user_tokens = [key for key, other in self._entries.items() if other.user_id == user_id]
+        for key in user_tokens[:-self.max_per_user]:
+            self.discard(key)
+
+        # The upload task ends first if decoding fails; its exception is the scan's error
+        await asyncio.wait([vision, entry.upload], return_when=asyncio.FIRST_COMPLETED)
+        if not vision.done():
+            self.discard(token)
+            vision.cancel()
+            entry.upload.result()
+        return token, vision.result()
+
+    @staticmethod
+    def _store(entry: PrefetchedImage, image_data: bytes, on_vision: Callable[[bytes], None]) -> tuple[str, str]:
+        stored_image, _ = image_service.compress_image_variants(image_data, on_vision=on_vision)
+        file_path = supabase_service.image_path(entry.user_id, stored_image)
+        image_url = storage_reclaimer.upload(file_path, stored_image, "image/jpeg")
+        return file_path, image_url
+
+    async def claim(self, token: str, user_id: str) -> Optional[tuple[str, str]]:
+        """
+        Take ownership of a stashed upload and its pin (unpin it once the item
+        row is inserted or the insert failed). Returns (file_path, image_url), or
+        None if the token is unknown, expired or belongs to another user, or
+        if the upload failed (the client then sends the file instead).
+        """
+        entry = self._entries.get(token)
+        if entry is None or entry.user_id != user_id or time.monotonic() - entry.created > self.ttl:
+            return None
+        del self._entries[token]
+        try:
+            return await entry.upload
+        except Exception as e:
+            logger.warning("Prefetched scan upload failed", extra={"user_id": user_id, "error": str(e)})
+            return None
+
+    def discard(self, token: str):
+        """Drop a stashed upload (e.g. the scan failed); the object is removed once uploaded."""
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            entry.upload.add_done_callback(self._reclaim)
+
+    @staticmethod
+    def _reclaim(upload: asyncio.Task):
+        # A failed or cancelled upload left nothing behind
+        if not upload.cancelled() and upload.exception() is None:
+            file_path, _ = upload.result()
+            storage_reclaimer.enqueue([file_path])
+            storage_reclaimer.unpin([file_path])
+
+    def expire(self) -> int:
+        """Discard unclaimed uploads older than the TTL. Returns the number discarded."""
+        cutoff = time.monotonic() - self.ttl
+        expired = [token for token, entry in self._entries.items() if entry.created < cutoff]
+        for token in expired:
+            self.discard(token)
+        return len(expired)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(min(self.ttl, 60))
+            expired = self.expire()
+            if expired:
+                logger.info("Expired unclaimed scan uploads", extra={"objects": expired})
+
+    def start(self):
+        """Start the expiry task (call from the app's startup hook)."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the expiry task; unclaimed uploads cannot be claimed after a restart, so reclaim them all."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for token in list(self._entries):
+            entry = self._entries.pop(token)
+            try:
+                file_path, _ = await entry.upload
+                storage_reclaimer.enqueue([file_path])
+                storage_reclaimer.unpin([file_path])
+            except Exception:
+                pass
+
+# Singleton instance
+scan_prefetch_service = ScanPrefetchService()
@@ -0,0 +1,53 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable, Optional
+from app.services.metrics_service import metrics_service
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls into one.
+
+    The first caller for a key runs the call; callers that arrive with the
+    same key while it is in flight wait for it and get its result (or its
+    exception). Nothing is cached: once the call returns, the next caller
+    starts a new one, so results are never older than the caller's arrival.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, func: Callable[[], Any], share: Optional[Callable[[Any], Any]] = None) -> Any:
+        """
+        Run func() for key, or join the identical call already in flight.
+
+        Args:
+            key: Identifies identical calls (must include every argument)
+            func: The upstream call
+            share: Applied to the result before it is handed to each caller,
+                   e.g. a copy so one request cannot mutate another's data
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            metrics_service.coalesced_calls.inc(self.name)
+            result = future.result()
+            return share(result) if share else result
+
+        try:
+            result = func()
+        except BaseException as e:
+            with self._lock:
+                del self._calls[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._calls[key]
+        future.set_result(result)
+        return share(result) if share else result
@@ -0,0 +1,162 @@
+import os
+import time
+import logging
+import asyncio
+import threading
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Optional
+from app.services.supabase_service import supabase_service
+
+logger = logging.getLogger(__name__)
+
+class StorageReclaimer:
+    """
+    Background garbage collector for wardrobe images.
+
+    Deletes enqueue image paths instead of removing them inline; a background
+    task removes them in batches and retries transient failures. A periodic
+    sweep also removes objects under each {user_id}/ prefix that no wardrobe
+    item references (e.g. left behind by a crash between upload and insert).
+
+    Image paths are content-addressed, so one object can back several items.
+    Right before removal each path is checked against the user's wardrobe
+    and against pinned paths, and paths still in use are kept. Every upload
+    goes through upload(), which pins the path until the caller unpins it
+    once the row pointing at it is committed (or will not be). Pinning
+    waits for a removal batch in progress, so an upload that dedupes
+    against an object can never be followed by that object's removal.
+    """
+
+    BATCH_SIZE = 100  # Max paths per storage remove call
+    MAX_ATTEMPTS = 5  # After this the sweep is left to pick the object up
+
+    def __init__(self):
+        self.flush_interval = float(os.getenv("STORAGE_RECLAIM_INTERVAL_SECONDS", "5"))
+        self.sweep_interval = float(os.getenv("STORAGE_SWEEP_INTERVAL_SECONDS", str(6 * 60 * 60)))
+        # Objects younger than this are never swept - their insert may still be in flight
+        self.sweep_grace_seconds = float(os.getenv("STORAGE_SWEEP_GRACE_SECONDS", "3600"))
+        self._pending: deque[tuple[str, int]] = deque()
+        # path -> number of uploads whose row is not committed yet
+        self._pins: Counter[str] = Counter()
+        self._pins_lock = threading.Lock()
+        # Held from the reference check to the end of the removal, and by pin()
+        self._removal_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def enqueue(self, paths: list[str]):
+        """Schedule storage objects for removal."""
+        with self._lock:
+            self._pending.extend((path, 0) for path in paths if path)
+
+    def pin(self, path: str):
+        """
+        Keep a path from being removed until unpin(). Blocks while a removal
+        batch is running, so call it from a worker thread.
+        """
+        with self._removal_lock, self._pins_lock:
+            self._pins[path] += 1
+
+    def unpin(self, paths: list[str]):
+        """Release pins once the rows pointing at the paths are committed, or will not be."""
+        with self._pins_lock:
+            for path in paths:
+                if path:
+                    self._pins[path] -= 1
+                    if self._pins[path] <= 0:
+                        del self._pins[path]
+
+    def upload(self, file_path: str, file_data: bytes, content_type: str = "image/jpeg") -> str:
+        """Pin a path and upload the object (blocking); the caller unpins it after its insert. Returns the URL."""
+        self.pin(file_path)
+        try:
+            return supabase_service.upload_image(file_path=file_path, file_data=file_data, content_type=content_type)
+        except BaseException:
+            self.unpin([file_path])
+            raise
+
+    def _still_referenced(self, paths: list[str]) -> set[str]:
+        # Pins first: a pin released after this snapshot was released after its row committed,
+        # so the wardrobe query below sees that row
+        with self._pins_lock:
+            in_use = set(self._pins)
+        for user_id in {path.split("/", 1)[0] for path in paths}:
+            in_use |= supabase_service.get_image_paths(user_id)
+        return in_use.intersection(paths)
+
+    def flush(self) -> int:
+        """Remove all pending objects now, in batches. Returns the number removed."""
+        removed = 0
+        while True:
+            with self._lock:
+                batch = [self._pending.popleft() for _ in range(min(self.BATCH_SIZE, len(self._pending)))]
+            if not batch:
+                return removed
+
+            try:
+                with self._removal_lock:
+                    referenced = self._still_referenced([path for path, _ in batch])
+                    unreferenced = [path for path, _ in batch if path not in referenced]
+                    if unreferenced:
+                        supabase_service.remove_images(unreferenced)
+                removed += len(unreferenced)
+            except Exception as e:
+                logger.warning("Storage removal failed", extra={"objects": len(batch), "error": str(e)})
+                retry = [(path, attempts + 1) for path, attempts in batch if attempts + 1 < self.MAX_ATTEMPTS]
+                with self._lock:
+                    self._pending.extend(retry)
+                return removed
+
+    def sweep(self) -> int:
+        """Remove unreferenced objects under every user prefix. Returns the number removed."""
+        cutoff = time.time() - self.sweep_grace_seconds
+        removed = 0
+
+        for user_id in supabase_service.list_storage_folders():
+            referenced = supabase_service.get_image_paths(user_id)
+            orphans = []
+            for obj in supabase_service.list_user_images(user_id):
+                path = f"{user_id}/{obj['name']}"
+                created_at = obj.get("created_at")
+                if path in referenced or not created_at:
+                    continue
+                created = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+                if created.replace(tzinfo=created.tzinfo or timezone.utc).timestamp() < cutoff:
+                    orphans.append(path)
+
+            if orphans:
+                self.enqueue(orphans)
+                removed += len(orphans)
+
+        self.flush()
+        return removed
+
+    async def _run(self):
+        next_sweep = time.monotonic() + self.sweep_interval
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+                if time.monotonic() >= next_sweep:
+                    next_sweep = time.monotonic() + self.sweep_interval
+                    swept = await asyncio.to_thread(self.sweep)
+                    if swept:
+                        logger.info("Storage sweep removed orphaned objects", extra={"objects": swept})
+            except Exception:
+                logger.exception("Storage reclaimer error")
+
+    def start(self):
+        """Start the background task (call from the app's startup hook)."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task and flush whatever is still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+# Singleton instance
+storage_reclaimer = StorageReclaimer()
@@ -1,20 +1,90 @@
 import os
-from supabase import create_client, Client
-from typing import Optional
-from dotenv import load_dotenv
+import hashlib
+import inspect
+import logging
+import functools
+import threading
+from typing import Callable, Optional, TYPE_CHECKING
+from app.services.metrics_service import metrics_service
+from app.services.single_flight import SingleFlight
+from app.services.wardrobe_replica import wardrobe_replica
 
-load_dotenv()
+if TYPE_CHECKING:
+    from supabase import Client
+
+logger = logging.getLogger(__name__)
+
+class WardrobeLimitError(Exception):
+    """Raised when a user's wardrobe already holds the maximum number of items."""
+
+def _changes_wardrobe(method):
+    """
+    Marks a method that writes a user's wardrobe. When it finishes (even by
+    raising), wardrobe reads already in flight stop being shared, so a read
+    that starts after a write never receives a result fetched before it.
+    A write that raised may still have been applied, so the local replica
+    resyncs that user on the next read.
+    """
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        user_id = signature.bind(self, *args, **kwargs).arguments["user_id"]
+        try:
+            return method(self, *args, **kwargs)
+        except BaseException:
+            wardrobe_replica.mark_stale(user_id)
+            raise
+        finally:
+            with self._generation_lock:
+                self._wardrobe_generations[user_id] = self._wardrobe_generations.get(user_id, 0) + 1
+    return wrapper
 
 class SupabaseService:
+    MAX_WARDROBE_ITEMS = 100
+    # Image objects are content-addressed, so their bytes never change under a URL
+    IMAGE_CACHE_SECONDS = 365 * 24 * 60 * 60
+
     def __init__(self):
-        supabase_url = os.getenv("SUPABASE_URL")
-        supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
+        self._client: Optional["Client"] = None
+        self._client_lock = threading.Lock()
+        self.storage_bucket = "wardrobe-images"
+        # Last known item count per user, maintained by the write paths
+        self._item_counts: dict[str, int] = {}
+        # Concurrent identical reads share one upstream call
+        self._user_flights = SingleFlight("get_user")
+        self._wardrobe_flights = SingleFlight("get_wardrobe_items")
+        self._replica_flights = SingleFlight("sync_wardrobe_replica")
+        # Bumped by every wardrobe write; part of the wardrobe read key
+        self._wardrobe_generations: dict[str, int] = {}
+        self._generation_lock = threading.Lock()
 
-        if not supabase_url or not supabase_key:
-            raise ValueError("Missing SUPABASE_URL or SUPABASE_SERVICE_KEY environment variables")
+    @property
+    def client(self) -> "Client":
+        """
+        The Supabase client, created on first use.
 
-        self.client: Client = create_client(supabase_url, supabase_key)
-        self.storage_bucket = "wardrobe-images"
+        Importing supabase and building the client is a large share of cold
+        start, so it happens on the first request (or in the warm-up task)
+        rather than at import time.
+        """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    supabase_url = os.getenv("SUPABASE_URL")
+                    supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
+
+                    if not supabase_url or not supabase_key:
+                        raise ValueError("Missing SUPABASE_URL or SUPABASE_SERVICE_KEY environment variables")
+
+                    from supabase import create_client
+                    self._client = create_client(supabase_url, supabase_key)
+        return self._client
+
+    def warm_up(self):
+        """Create the client and open the database and storage connections."""
+        self.client.table("wardrobe_items").select("id").limit(1).execute()
+        self.client.storage.from_(self.storage_bucket).list("", {"limit": 1})
 
     # Auth methods
     def sign_up(self, email: str, password: str):
@@ -34,7 +104,15 @@ class SupabaseService:
         return response
 
     def get_user(self, access_token: str):
-        """Get user information from access token."""
+        """
+        Get user information from access token.
+
+        Concurrent verifications of the same token share one call.
+        """
+        return self._user_flights.do(access_token, lambda: self._fetch_user(access_token))
+
+    @metrics_service.upstream("get_user")
+    def _fetch_user(self, access_token: str):
         response = self.client.auth.get_user(access_token)
         return response
 
@@ -42,9 +120,44 @@ class SupabaseService:
     def get_wardrobe_items(self, user_id: str, color: Optional[str] = None,
                           warmth: Optional[str] = None,
                           formality_min: Optional[int] = None,
-                          formality_max: Optional[int] = None):
-        """Get all wardrobe items for a user with optional filters."""
-        query = self.client.table("wardrobe_items").select("*").eq("user_id", user_id)
+                          formality_max: Optional[int] = None,
+                          fields: Optional[list[str]] = None,
+                          limit: Optional[int] = None,
+                          after: Optional[tuple[str, str]] = None):
+        """
+        Get wardrobe items for a user with optional filters, newest first.
+
+        Concurrent identical queries for a user share one call, unless a
+        write to that user's wardrobe finished after the shared call started.
+        With the local replica enabled, reads are served from it instead.
+
+        Args:
+            fields: Columns to select (default all)
+            limit: Maximum number of rows (default all)
+            after: Keyset cursor (created_at, id) of the last row already seen
+        """
+        if wardrobe_replica.enabled:
+            return self._from_replica(user_id, lambda: wardrobe_replica.query(
+                user_id, color, warmth, formality_min, formality_max, fields, limit, after
+            ))
+
+        query_args = (user_id, color, warmth, formality_min, formality_max,
+                      tuple(fields) if fields else None, limit, after)
+        key = (self._wardrobe_generations.get(user_id, 0), *query_args)
+        return self._wardrobe_flights.do(
+            key,
+            lambda: self._query_wardrobe_items(*query_args),
+            # Each caller gets its own row dicts
+            share=lambda rows: [dict(row) for row in rows],
+        )
+
+    @metrics_service.upstream("get_wardrobe_items")
+    def _query_wardrobe_items(self, user_id: str, color: Optional[str], warmth: Optional[str],
+                              formality_min: Optional[int], formality_max: Optional[int],
+                              fields: Optional[tuple[str, ...]], limit: Optional[int],
+                              after: Optional[tuple[str, str]]) -> list:
+        columns = ",".join(fields) if fields else "*"
+        query = self.client.table("wardrobe_items").select(columns).eq("user_id", user_id)
 
         if color:
             query = query.eq("color", color)
@@ -54,15 +167,76 @@ class SupabaseService:
             query = query.gte("formality", formality_min)
         if formality_max is not None:
             query = query.lte("formality", formality_max)
+        if after is not None:
+            created_at, item_id = after
+            query = query.or_(
+                f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{item_id})'
+            )
+
+        query = query.order("created_at", desc=True).order("id", desc=True)
+        if limit is not None:
+            query = query.limit(limit)
 
-        response = query.order("created_at", desc=True).execute()
+        response = query.execute()
+        return response.data
+
+    def sync_wardrobe_replica(self, user_id: str):
+        """Bring the local replica's copy of a user's wardrobe up to date (one change-feed call)."""
+        def sync():
+            since = wardrobe_replica.version(user_id)
+            if since is None:
+                # Initial load: -1 also picks up rows from before the version column existed (version 0)
+                wardrobe_replica.apply_changes(user_id, self.get_wardrobe_changes(user_id, -1), full=True)
+            else:
+                wardrobe_replica.apply_changes(user_id, self.get_wardrobe_changes(user_id, since))
+
+        self._replica_flights.do(user_id, sync)
+
+    def _from_replica(self, user_id: str, read: Callable):
+        """Run a replica read, syncing first if the copy is stale; serve stale data if Supabase is down."""
+        if not wardrobe_replica.is_fresh(user_id):
+            try:
+                self.sync_wardrobe_replica(user_id)
+            except Exception as e:
+                if wardrobe_replica.version(user_id) is None:
+                    raise
+                logger.warning("Wardrobe replica sync failed, serving stale copy",
+                               extra={"user_id": user_id, "error": str(e)})
+        return read()
+
+    def get_wardrobe_version(self, user_id: str) -> int:
+        """Current wardrobe version for a user (0 if they have never had items)."""
+        if wardrobe_replica.enabled:
+            return self._from_replica(user_id, lambda: wardrobe_replica.version(user_id))
+        return self._fetch_wardrobe_version(user_id)
+
+    @metrics_service.upstream("get_wardrobe_version")
+    def _fetch_wardrobe_version(self, user_id: str) -> int:
+        response = self.client.table("wardrobe_versions").select("version").eq("user_id", user_id).execute()
+        return response.data[0]["version"] if response.data else 0
+
+    @metrics_service.upstream("get_wardrobe_changes")
+    def get_wardrobe_changes(self, user_id: str, since: int) -> dict:
+        """
+        Items changed and deleted since a wardrobe version, in one call.
+
+        Returns {"version", "reset", "upserted", "deleted"}; reset is True when
+        the needed tombstones were pruned and upserted holds the full wardrobe.
+        """
+        response = self.client.rpc("get_wardrobe_changes", {"p_user_id": user_id, "p_since": since}).execute()
         return response.data
 
     def count_wardrobe_items(self, user_id: str) -> int:
         """Count total wardrobe items for a user."""
         response = self.client.table("wardrobe_items").select("id", count="exact").eq("user_id", user_id).execute()
+        self._item_counts[user_id] = response.count
         return response.count
 
+    def cached_item_count(self, user_id: str) -> Optional[int]:
+        """Last known item count for a user, without a database call (None if unknown)."""
+        return self._item_counts.get(user_id)
+
+    @_changes_wardrobe
     def create_wardrobe_item(self, user_id: str, item_data: dict):
         """Create a new wardrobe item."""
         data = {
@@ -70,8 +244,71 @@ class SupabaseService:
             "user_id": user_id
         }
         response = self.client.table("wardrobe_items").insert(data).execute()
+        wardrobe_replica.apply_write(user_id, response.data)
         return response.data[0] if response.data else None
 
+    @_changes_wardrobe
+    @metrics_service.upstream("create_wardrobe_item_limited")
+    def create_wardrobe_item_limited(self, user_id: str, item_data: dict):
+        """
+        Create a wardrobe item, enforcing MAX_WARDROBE_ITEMS atomically in the database.
+
+        Raises:
+            WardrobeLimitError: If the user's wardrobe is already full
+        """
+        try:
+            response = self.client.rpc("create_wardrobe_item_limited", {
+                "p_user_id": user_id,
+                "p_title": item_data["title"],
+                "p_description": item_data["description"],
+                "p_color": item_data["color"],
+                "p_warmth": item_data["warmth"],
+                "p_formality": item_data["formality"],
+                "p_image_url": item_data["image_url"],
+                "p_max_items": self.MAX_WARDROBE_ITEMS,
+            }).execute()
+        except Exception as e:
+            if "WARDROBE_LIMIT_REACHED" in str(e):
+                self._item_counts[user_id] = self.MAX_WARDROBE_ITEMS
+                raise WardrobeLimitError() from e
+            raise
+
+        if not response.data:
+            return None
+
+        self._item_counts[user_id] = response.data["item_count"]
+        wardrobe_replica.apply_write(user_id, [response.data["item"]])
+        return response.data["item"]
+
+    @_changes_wardrobe
+    @metrics_service.upstream("create_wardrobe_items_limited")
+    def create_wardrobe_items_limited(self, user_id: str, items: list[dict]) -> list:
+        """
+        Create several wardrobe items in one statement, all or nothing.
+
+        Raises:
+            WardrobeLimitError: If the items would take the wardrobe over MAX_WARDROBE_ITEMS
+        """
+        try:
+            response = self.client.rpc("create_wardrobe_items_limited", {
+                "p_user_id": user_id,
+                "p_items": items,
+                "p_max_items": self.MAX_WARDROBE_ITEMS,
+            }).execute()
+        except Exception as e:
+            if "WARDROBE_LIMIT_REACHED" in str(e):
+                raise WardrobeLimitError() from e
+            raise
+
+        if not response.data:
+            return []
+
+        self._item_counts[user_id] = response.data["item_count"]
+        wardrobe_replica.apply_write(user_id, response.data["items"])
+        return response.data["items"]
+
+    @_changes_wardrobe
+    @metrics_service.upstream("update_wardrobe_item")
     def update_wardrobe_item(self, item_id: str, user_id: str, update_data: dict):
         """Update an existing wardrobe item."""
         response = self.client.table("wardrobe_items") \
@@ -79,53 +316,155 @@ class SupabaseService:
             .eq("id", item_id) \
             .eq("user_id", user_id) \
             .execute()
+        wardrobe_replica.apply_write(user_id, response.data)
         return response.data[0] if response.data else None
 
+    @_changes_wardrobe
+    @metrics_service.upstream("update_wardrobe_items")
+    def update_wardrobe_items(self, item_ids: list[str], user_id: str, update_data: dict) -> list:
+        """Apply the same update to several wardrobe items in one query."""
+        response = self.client.table("wardrobe_items") \
+            .update(update_data) \
+            .in_("id", item_ids) \
+            .eq("user_id", user_id) \
+            .execute()
+        wardrobe_replica.apply_write(user_id, response.data)
+        return response.data
+
+    @_changes_wardrobe
+    @metrics_service.upstream("delete_wardrobe_item")
     def delete_wardrobe_item(self, item_id: str, user_id: str):
-        """Delete a wardrobe item."""
-        # First get the item to retrieve image_url
-        item_response = self.client.table("wardrobe_items") \
-            .select("image_url") \
+        """
+        Delete a wardrobe item in a single call.
+
+        Returns the deleted rows (including image_url) so the caller can
+        schedule storage cleanup, or None if nothing was deleted.
+        """
+        # PostgREST returns the deleted rows (delete ... returning *), so no prior select is needed
+        delete_response = self.client.table("wardrobe_items") \
+            .delete() \
             .eq("id", item_id) \
             .eq("user_id", user_id) \
             .execute()
 
-        if not item_response.data:
+        if not delete_response.data:
             return None
 
-        image_url = item_response.data[0]["image_url"]
+        wardrobe_replica.apply_delete(user_id, [item_id])
+        if user_id in self._item_counts:
+            self._item_counts[user_id] = max(self._item_counts[user_id] - len(delete_response.data), 0)
+
+        return delete_response.data
 
-        # Delete from database
+    @_changes_wardrobe
+    @metrics_service.upstream("delete_wardrobe_items")
+    def delete_wardrobe_items(self, item_ids: list[str], user_id: str) -> list:
+        """Delete several wardrobe items in one query, returning the deleted rows."""
         delete_response = self.client.table("wardrobe_items") \
             .delete() \
-            .eq("id", item_id) \
+            .in_("id", item_ids) \
             .eq("user_id", user_id) \
             .execute()
 
-        # Delete from storage if image exists
-        if image_url:
-            file_path = image_url.split(f"{self.storage_bucket}/")[-1]
-            self.client.storage.from_(self.storage_bucket).remove([file_path])
+        if delete_response.data and user_id in self._item_counts:
+            self._item_counts[user_id] = max(self._item_counts[user_id] - len(delete_response.data), 0)
 
+        wardrobe_replica.apply_delete(user_id, [row["id"] for row in delete_response.data or []])
         return delete_response.data
 
+    def get_image_paths(self, user_id: str) -> set[str]:
+        """Storage paths of every image referenced by a user's wardrobe items."""
+        response = self.client.table("wardrobe_items").select("image_url").eq("user_id", user_id).execute()
+        return {self.image_path_from_url(row["image_url"]) for row in response.data if row["image_url"]}
+
+    # Usage accounting
+    def insert_usage_rows(self, rows: list[dict]):
+        """Append aggregated OpenAI usage rows."""
+        return self.client.table("openai_usage").insert(rows).execute()
+
+    # Rate limiting
+    @metrics_service.upstream("take_rate_limit_tokens")
+    def take_rate_limit_tokens(self, key: str, cost: float, capacity: float, refill_per_second: float) -> tuple[bool, float]:
+        """Token bucket take shared by all nodes. Returns (allowed, tokens left)."""
+        response = self.client.rpc("take_rate_limit_tokens", {
+            "p_key": key,
+            "p_cost": cost,
+            "p_capacity": capacity,
+            "p_refill_per_second": refill_per_second,
+        }).execute()
+        return response.data["allowed"], response.data["tokens"]
+
     # Storage methods
+    @staticmethod
+    def image_path(user_id: str, image_data: bytes, extension: str = "jpg") -> str:
+        """
+        Content-addressed storage path for an image. The same bytes from the
+        same user always map to one object, which is stored once.
+        """
+        return f"{user_id}/{hashlib.sha256(image_data).hexdigest()}.{extension}"
+
+    @metrics_service.upstream("upload_image")
     def upload_image(self, file_path: str, file_data: bytes, content_type: str = "image/jpeg"):
-        """Upload an image to Supabase storage."""
-        response = self.client.storage.from_(self.storage_bucket).upload(
-            file_path,
-            file_data,
-            {"content-type": content_type}
-        )
+        """
+        Upload an image to Supabase storage (file_path from image_path()).
+
+        The object is cacheable for a year: its path is a hash of its bytes.
+        If the object already exists it holds the same bytes, so it is reused.
+        """
+        try:
+            self.client.storage.from_(self.storage_bucket).upload(
+                file_path,
+                file_data,
+                {"content-type": content_type, "cache-control": str(self.IMAGE_CACHE_SECONDS)}
+            )
+        except Exception as e:
+            if not self._is_duplicate(e):
+                raise
 
         # Get public URL
         public_url = self.client.storage.from_(self.storage_bucket).get_public_url(file_path)
         return public_url
 
-    def delete_image(self, file_path: str):
-        """Delete an image from Supabase storage."""
-        response = self.client.storage.from_(self.storage_bucket).remove([file_path])
-        return response
+    @staticmethod
+    def _is_duplicate(error: Exception) -> bool:
+        status = str(getattr(error, "status", ""))
+        return status == "409" or getattr(error, "code", None) == "Duplicate" or "already exists" in str(error)
+
+    @metrics_service.upstream("download_image")
+    def download_image(self, file_path: str) -> bytes:
+        """Download an image from Supabase storage."""
+        return self.client.storage.from_(self.storage_bucket).download(file_path)
+
+    @metrics_service.upstream("remove_images")
+    def remove_images(self, file_paths: list[str]):
+        """Delete several images from Supabase storage in one call."""
+        return self.client.storage.from_(self.storage_bucket).remove(file_paths)
+
+    def image_path_from_url(self, image_url: str) -> str:
+        """Convert a public image URL back to its storage path."""
+        return image_url.split(f"{self.storage_bucket}/")[-1].split("?")[0]
+
+    def _list_storage(self, prefix: str) -> list[dict]:
+        """List every entry directly under a storage prefix, following pagination."""
+        page_size = 1000
+        entries = []
+        offset = 0
+        while True:
+            page = self.client.storage.from_(self.storage_bucket).list(
+                prefix, {"limit": page_size, "offset": offset}
+            )
+            entries.extend(page)
+            if len(page) < page_size:
+                return entries
+            offset += page_size
+
+    def list_storage_folders(self) -> list[str]:
+        """Top-level folders in the bucket (one per user)."""
+        return [entry["name"] for entry in self._list_storage("") if entry.get("id") is None]
+
+    def list_user_images(self, user_id: str) -> list[dict]:
+        """Storage objects under a user's folder."""
+        return [entry for entry in self._list_storage(user_id) if entry.get("id") is not None]
 
 # Singleton instance
 supabase_service = SupabaseService()
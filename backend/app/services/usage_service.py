@@ -0,0 +1,151 @@
+import os
+import math
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+from typing import Optional
+from app.services.supabase_service import supabase_service
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class UsageTotals:
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    image_tokens: int = 0  # Estimated share of prompt_tokens spent on images
+    total_latency_ms: int = 0
+
+    def add(self, other: "UsageTotals"):
+        self.calls += other.calls
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.image_tokens += other.image_tokens
+        self.total_latency_ms += other.total_latency_ms
+
+class UsageService:
+    """
+    OpenAI token and latency accounting, aggregated per (user, endpoint, model).
+
+    Calls are aggregated in memory and flushed periodically to the
+    openai_usage table as one row per key per flush period. Totals since
+    process start are kept for the admin endpoint.
+    """
+
+    # USD per 1M tokens (input, output)
+    PRICING = {
+        "gpt-4o": (2.50, 10.00),
+        "gpt-4o-mini": (0.15, 0.60),
+    }
+
+    def __init__(self):
+        self.flush_interval = float(os.getenv("USAGE_FLUSH_INTERVAL_SECONDS", "60"))
+        self._pending: dict[tuple[Optional[str], str, str], UsageTotals] = {}
+        self._totals: dict[tuple[Optional[str], str, str], UsageTotals] = {}
+        self._period_start = datetime.now(timezone.utc)
+        self._started_at = self._period_start
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def estimate_image_tokens(detail: str, width: int, height: int) -> int:
+        """Token cost of one image input, per OpenAI's published tiling rules for GPT-4o."""
+        if detail == "low":
+            return 85
+        # Fit within 2048x2048, then scale the shortest side down to 768
+        scale = min(1.0, 2048 / max(width, height))
+        width, height = width * scale, height * scale
+        scale = min(1.0, 768 / min(width, height))
+        width, height = width * scale, height * scale
+        return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+    def record(self, user_id: Optional[str], endpoint: str, model: str, usage,
+               latency_seconds: float, image_tokens: int = 0):
+        """Record one completion call. usage is the response.usage object (may be None)."""
+        call = UsageTotals(
+            calls=1,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+            image_tokens=image_tokens,
+            total_latency_ms=int(latency_seconds * 1000),
+        )
+        key = (user_id, endpoint, model)
+        with self._lock:
+            self._pending.setdefault(key, UsageTotals()).add(call)
+            self._totals.setdefault(key, UsageTotals()).add(call)
+
+    def estimated_cost(self, model: str, totals: UsageTotals) -> float:
+        input_price, output_price = self.PRICING.get(model, (0.0, 0.0))
+        return (totals.prompt_tokens * input_price + totals.completion_tokens * output_price) / 1_000_000
+
+    def summary(self, group_by: str = "user") -> dict:
+        """Totals since process start, grouped by "user", "endpoint" or "model"."""
+        index = {"user": 0, "endpoint": 1, "model": 2}[group_by]
+        with self._lock:
+            snapshot = {key: UsageTotals(**asdict(totals)) for key, totals in self._totals.items()}
+
+        groups: dict[str, dict] = {}
+        for key, totals in snapshot.items():
+            group = groups.setdefault(str(key[index]), {**asdict(UsageTotals()), "estimated_cost_usd": 0.0})
+            for name, value in asdict(totals).items():
+                group[name] += value
+            group["estimated_cost_usd"] += self.estimated_cost(key[2], totals)
+
+        for group in groups.values():
+            group["estimated_cost_usd"] = round(group["estimated_cost_usd"], 6)
+            group["avg_latency_ms"] = round(group["total_latency_ms"] / group["calls"]) if group["calls"] else 0
+
+        return {"since": self._started_at.isoformat(), "group_by": group_by, "groups": groups}
+
+    def flush(self):
+        """Write aggregates accumulated since the last flush to Supabase."""
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            period_start, self._period_start = self._period_start, now
+
+        if not pending:
+            return
+
+        rows = [
+            {
+                "user_id": user_id,
+                "endpoint": endpoint,
+                "model": model,
+                "period_start": period_start.isoformat(),
+                "period_end": now.isoformat(),
+                **asdict(totals),
+            }
+            for (user_id, endpoint, model), totals in pending.items()
+        ]
+        try:
+            supabase_service.insert_usage_rows(rows)
+        except Exception:
+            logger.exception("Usage flush failed", extra={"rows": len(rows)})
+            # Put the aggregates back so the next flush retries them
+            with self._lock:
+                for key, totals in pending.items():
+                    self._pending.setdefault(key, UsageTotals()).add(totals)
+                self._period_start = period_start
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.to_thread(self.flush)
+
+    def start(self):
+        """Start periodic flushing (call from the app's startup hook)."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop periodic flushing and write what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+# Singleton instance
+usage_service = UsageService()
@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+class WardrobeReplica:
+    """
+    Optional node-local SQLite copy of wardrobe_items, enabled by setting
+    WARDROBE_REPLICA_PATH.
+
+    A user's wardrobe is loaded on first read. After that it is kept
+    current in three ways. This node's writes are applied as they happen.
+    A background task pulls the wardrobe change feed (get_wardrobe_changes)
+    for recently active users. A read whose copy is older than
+    max_staleness syncs inline first. SupabaseService serves wardrobe reads
+    from here and falls back to the stale copy if the sync fails.
+
+    Writes made on other nodes show up within max_staleness.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS items (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            created_us INTEGER NOT NULL,  -- created_at as epoch microseconds, for ordering
+            color TEXT,
+            warmth TEXT,
+            formality INTEGER,
+            data TEXT NOT NULL            -- the full row as JSON
+        );
+        CREATE INDEX IF NOT EXISTS items_user_created ON items(user_id, created_us DESC, id DESC);
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,     -- wardrobe version the copy is current to
+            synced_at REAL NOT NULL       -- when it was last confirmed current (0 = needs sync)
+        );
+    """
+
+    def __init__(self):
+        self.path = os.getenv("WARDROBE_REPLICA_PATH")
+        self.enabled = bool(self.path)
+        self.max_staleness = float(os.getenv("WARDROBE_REPLICA_MAX_STALENESS_SECONDS", "15"))
+        self.sync_interval = float(os.getenv("WARDROBE_REPLICA_SYNC_INTERVAL_SECONDS", "5"))
+        # Users not read for this long are left out of background syncs
+        self.active_window = float(os.getenv("WARDROBE_REPLICA_ACTIVE_SECONDS", "600"))
+        self._conn: Optional[sqlite3.Connection] = None
+        # Last read per user, in memory only - after a restart users become active again on their next read
+        self._read_at: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # Callers hold self._lock
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=OFF")  # A lost replica is rebuilt from Supabase
+            self._conn.executescript(self.SCHEMA)
+        return self._conn
+
+    @staticmethod
+    def _timestamp_us(value: str) -> int:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return round(parsed.timestamp() * 1_000_000)
+
+    def _upsert(self, user_id: str, rows: list[dict]):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO items (id, user_id, created_us, color, warmth, formality, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(row["id"], user_id, self._timestamp_us(row["created_at"]), row.get("color"),
+              row.get("warmth"), row.get("formality"), json.dumps(row)) for row in rows],
+        )
+
+    def _delete(self, user_id: str, item_ids: list[str]):
+        self.conn.executemany("DELETE FROM items WHERE user_id = ? AND id = ?",
+                              [(user_id, item_id) for item_id in item_ids])
+
+    def version(self, user_id: str) -> Optional[int]:
+        """Wardrobe version of the local copy, or None if the user is not loaded."""
+        with self._lock:
+            row = self.conn.execute("SELECT version FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def is_fresh(self, user_id: str) -> bool:
+        with self._lock:
+            row = self.conn.execute("SELECT synced_at FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return row is not None and time.time() - row[0] <= self.max_staleness
+
+    def apply_changes(self, user_id: str, changes: dict, full: bool = False):
+        """
+        Apply a get_wardrobe_changes result. With full (initial load) or a
+        reset, upserted is the whole wardrobe and replaces the local copy.
+        """
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                if full or changes["reset"]:
+                    self.conn.execute("DELETE FROM items WHERE user_id = ?", (user_id,))
+                self._upsert(user_id, changes["upserted"])
+                self._delete(user_id, changes["deleted"])
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO users (user_id, version, synced_at) VALUES (?, ?, ?)",
+                    (user_id, changes["version"], time.time()),
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def apply_write(self, user_id: str, rows: list[dict]):
+        """
+        Apply rows inserted or updated by this node.
+
+        Each write bumps the wardrobe version by one per row. If the rows'
+        versions directly follow the local version, no other node wrote in
+        between and the copy stays fresh. Otherwise the next read syncs first.
+        """
+        if not self.enabled or not rows:
+            return
+        with self._lock:
+            state = self.conn.execute("SELECT version FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            if state is None:
+                return
+            self._upsert(user_id, rows)
+            versions = sorted(row.get("version", 0) for row in rows)
+            if versions == list(range(state[0] + 1, state[0] + 1 + len(rows))):
+                self.conn.execute("UPDATE users SET version = ? WHERE user_id = ?", (versions[-1], user_id))
+            else:
+                self.conn.execute("UPDATE users SET synced_at = 0 WHERE user_id = ?", (user_id,))
+
+    def apply_delete(self, user_id: str, item_ids: list[str]):
+        """Apply deletes made by this node (deleted rows do not carry the new version, so sync next read)."""
+        if not self.enabled or not item_ids:
+            return
+        with self._lock:
+            self._delete(user_id, item_ids)
+            self.conn.execute("UPDATE users SET synced_at = 0 WHERE user_id = ?", (user_id,))
+
+    def mark_stale(self, user_id: str):
+        """Make the next read of this user sync first."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.conn.execute("UPDATE users SET synced_at = 0 WHERE user_id = ?", (user_id,))
+
+    def query(self, user_id: str, color: Optional[str] = None, warmth: Optional[str] = None,
+              formality_min: Optional[int] = None, formality_max: Optional[int] = None,
+              fields: Optional[list[str]] = None, limit: Optional[int] = None,
+              after: Optional[tuple[str, str]] = None) -> list[dict]:
+        """Same filters, ordering and keyset semantics as SupabaseService.get_wardrobe_items."""
+        sql = "SELECT data FROM items WHERE user_id = ?"
+        params: list = [user_id]
+        if color:
+            sql += " AND color = ?"
+            params.append(color)
+        if warmth:
+            sql += " AND warmth = ?"
+            params.append(warmth)
+        if formality_min is not None:
+            sql += " AND formality >= ?"
+            params.append(formality_min)
+        if formality_max is not None:
+            sql += " AND formality <= ?"
+            params.append(formality_max)
+        if after is not None:
+            created_us = self._timestamp_us(after[0])
+            sql += " AND (created_us < ? OR (created_us = ? AND id < ?))"
+            params += [created_us, created_us, after[1]]
+        sql += " ORDER BY created_us DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        self._read_at[user_id] = time.time()
+
+        items = [json.loads(data) for (data,) in rows]
+        if fields:
+            items = [{name: item.get(name) for name in fields} for item in items]
+        return items
+
+    def active_users(self) -> list[str]:
+        cutoff = time.time() - self.active_window
+        return [user_id for user_id, read_at in list(self._read_at.items()) if read_at >= cutoff]
+
+    async def _run(self, sync: Callable[[str], None]):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            for user_id in await asyncio.to_thread(self.active_users):
+                try:
+                    await asyncio.to_thread(sync, user_id)
+                except Exception as e:
+                    logger.warning("Wardrobe replica sync failed", extra={"user_id": user_id, "error": str(e)})
+
+    def start(self, sync: Callable[[str], None]):
+        """Start background syncing of active users (call from the app's startup hook)."""
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(sync))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+# Singleton instance
+wardrobe_replica = WardrobeReplica()
@@ -0,0 +1,60 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Optional
+from app.services.image_service import image_service
+from app.services.openai_service import openai_service
+from app.services.supabase_service import supabase_service
+
+logger = logging.getLogger(__name__)
+
+class WarmupService:
+    """
+    Optional background warm-up after startup.
+
+    Clients and heavy libraries are loaded lazily, so a fresh instance
+    answers /health as soon as the app is imported. With WARMUP_ON_STARTUP
+    enabled, this task then loads Pillow and creates the Supabase and
+    OpenAI clients in a worker thread. It also opens their connection
+    pools, so the first real request does not pay for it. Failures are
+    logged and otherwise ignored; the request path creates anything that
+    is still missing.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("WARMUP_ON_STARTUP", "false").lower() == "true"
+        self.status = "pending" if self.enabled else "disabled"
+        self._task: Optional[asyncio.Task] = None
+
+    def warm_up(self):
+        """Run each warm-up step in turn (blocking)."""
+        self.status = "running"
+        failed = False
+        for name, step in (
+            ("image", image_service.warm_up),
+            ("supabase", supabase_service.warm_up),
+            ("openai", openai_service.warm_up),
+        ):
+            start = time.perf_counter()
+            try:
+                step()
+                logger.info("Warm-up step done", extra={"step": name, "duration_ms": round((time.perf_counter() - start) * 1000)})
+            except Exception as e:
+                failed = True
+                logger.warning("Warm-up step failed", extra={"step": name, "error": str(e)})
+        self.status = "partial" if failed else "done"
+
+    def start(self):
+        """Start warming up in the background (call from the app's startup hook)."""
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(asyncio.to_thread(self.warm_up))
+
+    async def stop(self):
+        """Stop waiting for the warm-up; a step already running finishes in its thread."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+# Singleton instance
+warmup_service = WarmupService()
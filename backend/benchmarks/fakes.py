@@ -0,0 +1,289 @@
+"""
+In-process stand-ins for SupabaseService and OpenAIService.
+
+They keep the real services' interfaces (they subclass them and reuse the
+pure helpers) but replace every network call with an in-memory store and a
+sleep drawn from a configurable latency distribution. Upstream calls in
+the real services are synchronous, so the fakes block the same way.
+"""
+import math
+import time
+import uuid
+import random
+import itertools
+from types import SimpleNamespace
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional
+from app.services.openai_service import OpenAIService
+from app.services.supabase_service import SupabaseService, WardrobeLimitError, _changes_wardrobe
+
+class LatencyModel:
+    """Log-normal latency defined by its median and p99, in milliseconds."""
+
+    def __init__(self, median_ms: float, p99_ms: float, rng: random.Random):
+        self.mu = math.log(median_ms / 1000)
+        # z(0.99) = 2.326
+        self.sigma = math.log(p99_ms / median_ms) / 2.326 if p99_ms > median_ms else 0.0
+        self.rng = rng
+
+    def sleep(self):
+        time.sleep(self.rng.lognormvariate(self.mu, self.sigma))
+
+# (median ms, p99 ms) per upstream call, roughly what the hosted services show
+DEFAULT_LATENCIES = {
+    "auth": (60, 250),
+    "db_read": (40, 200),
+    "db_write": (60, 300),
+    "storage_upload": (150, 800),
+    "storage_download": (80, 400),
+    "vision": (2500, 8000),
+    "chat": (4000, 12000),
+}
+
+SAMPLE_TITLES = [
+    ("White Oxford Shirt", "White"), ("Blue Denim Jeans", "Blue"), ("Black Leather Jacket", "Black"),
+    ("Gray Crewneck Sweater", "Gray"), ("Khaki Chinos", "Brown"), ("Navy Wool Blazer", "Blue"),
+    ("Red Flannel Shirt", "Red"), ("Black Tailored Trousers", "Black"), ("Olive Field Jacket", "Green"),
+    ("Pink Linen Shirt", "Pink"), ("Beige Trench Coat", "Brown"), ("Yellow Graphic Tee", "Yellow"),
+    ("Purple Knit Cardigan", "Purple"), ("Orange Puffer Jacket", "Orange"), ("Gray Wool Trousers", "Gray"),
+    ("White Linen Shorts", "White"), ("Green Hoodie", "Green"), ("Blue Polo Shirt", "Blue"),
+]
+WARMTHS = ["Cold", "Cool", "Neutral", "Warm", "Hot"]
+
+def make_wardrobe(user_id: str, count: int, rng: random.Random) -> list[dict]:
+    """Generate realistic-looking wardrobe rows."""
+    now = datetime.now(timezone.utc)
+    items = []
+    for i in range(count):
+        title, color = SAMPLE_TITLES[i % len(SAMPLE_TITLES)]
+        item_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        items.append({
+            "id": item_id,
+            "user_id": user_id,
+            "title": f"{title} {i // len(SAMPLE_TITLES) + 1}" if i >= len(SAMPLE_TITLES) else title,
+            "description": f"A {title.lower()} with a relaxed fit and subtle texture, easy to layer for everyday wear.",
+            "color": color,
+            "warmth": rng.choice(WARMTHS),
+            "formality": rng.randint(1, 10),
+            "image_url": f"https://fake.supabase.co/storage/v1/object/public/wardrobe-images/{user_id}/{item_id}.jpg",
+            "created_at": (now - timedelta(minutes=i)).isoformat(),
+            "updated_at": (now - timedelta(minutes=i)).isoformat(),
+            "version": i + 1,
+        })
+    return items
+
+class FakeSupabaseService(SupabaseService):
+    """
+    SupabaseService backed by an in-memory store.
+
+    Reads override the private fetch methods, so the real single-flight
+    layer in front of them is part of what gets measured.
+    """
+
+    def __init__(self, latencies: dict, rng: random.Random, wardrobe_size: int = 100):
+        # The client is created lazily and never touched here
+        super().__init__()
+        self.latency = {name: LatencyModel(*value, rng) for name, value in latencies.items()}
+        self.rng = rng
+        self.wardrobe_size = wardrobe_size
+        self.items: dict[str, list[dict]] = {}
+        self.versions: dict[str, int] = {}
+        self.objects: dict[str, bytes] = {}
+        self._versions = itertools.count(10_000)
+
+    def _wardrobe(self, user_id: str) -> list[dict]:
+        if user_id not in self.items:
+            self.items[user_id] = make_wardrobe(user_id, self.wardrobe_size, self.rng)
+            self.versions[user_id] = self.wardrobe_size
+        return self.items[user_id]
+
+    def _bump(self, user_id: str) -> int:
+        self.versions[user_id] = next(self._versions)
+        return self.versions[user_id]
+
+    # Auth
+    def sign_up(self, email: str, password: str):
+        self.latency["auth"].sleep()
+        return self.sign_in(email, password)
+
+    def sign_in(self, email: str, password: str):
+        self.latency["auth"].sleep()
+        user = SimpleNamespace(id=str(uuid.uuid5(uuid.NAMESPACE_DNS, email)), email=email)
+        return SimpleNamespace(user=user, session=SimpleNamespace(access_token=f"token-{user.id}"))
+
+    def _fetch_user(self, access_token: str):
+        self.latency["auth"].sleep()
+        user_id = access_token.removeprefix("token-")
+        return SimpleNamespace(user=SimpleNamespace(id=user_id, email=f"{user_id}@example.com"))
+
+    # Wardrobe
+    def _query_wardrobe_items(self, user_id: str, color: Optional[str], warmth: Optional[str],
+                              formality_min: Optional[int], formality_max: Optional[int],
+                              fields: Optional[tuple[str, ...]], limit: Optional[int],
+                              after: Optional[tuple[str, str]]) -> list:
+        self.latency["db_read"].sleep()
+        rows = [
+            item for item in self._wardrobe(user_id)
+            if (not color or item["color"] == color)
+            and (not warmth or item["warmth"] == warmth)
+            and (formality_min is None or item["formality"] >= formality_min)
+            and (formality_max is None or item["formality"] <= formality_max)
+            and (after is None or (item["created_at"], item["id"]) < after)
+        ]
+        rows.sort(key=lambda item: (item["created_at"], item["id"]), reverse=True)
+        if limit is not None:
+            rows = rows[:limit]
+        if fields:
+            rows = [{name: item[name] for name in fields} for item in rows]
+        return [dict(item) for item in rows]
+
+    def _fetch_wardrobe_version(self, user_id: str) -> int:
+        self.latency["db_read"].sleep()
+        self._wardrobe(user_id)
+        return self.versions[user_id]
+
+    def get_wardrobe_changes(self, user_id: str, since: int) -> dict:
+        self.latency["db_read"].sleep()
+        items = self._wardrobe(user_id)
+        return {
+            "version": self.versions[user_id],
+            "reset": False,
+            "upserted": [dict(item) for item in items if item["version"] > since],
+            "deleted": [],
+        }
+
+    def count_wardrobe_items(self, user_id: str) -> int:
+        self.latency["db_read"].sleep()
+        count = len(self._wardrobe(user_id))
+        self._item_counts[user_id] = count
+        return count
+
+    def get_image_paths(self, user_id: str) -> set[str]:
+        self.latency["db_read"].sleep()
+        return {self.image_path_from_url(item["image_url"]) for item in self._wardrobe(user_id)}
+
+    def _insert(self, user_id: str, item_data: dict) -> dict:
+        now = datetime.now(timezone.utc).isoformat()
+        item = {**item_data, "id": str(uuid.uuid4()), "user_id": user_id,
+                "created_at": now, "updated_at": now, "version": self._bump(user_id)}
+        self._wardrobe(user_id).insert(0, item)
+        return dict(item)
+
+    @_changes_wardrobe
+    def create_wardrobe_item(self, user_id: str, item_data: dict):
+        self.latency["db_write"].sleep()
+        return self._insert(user_id, item_data)
+
+    @_changes_wardrobe
+    def create_wardrobe_item_limited(self, user_id: str, item_data: dict):
+        self.latency["db_write"].sleep()
+        if len(self._wardrobe(user_id)) >= self.MAX_WARDROBE_ITEMS:
+            raise WardrobeLimitError()
+        item = self._insert(user_id, item_data)
+        self._item_counts[user_id] = len(self._wardrobe(user_id))
+        return item
+
+    @_changes_wardrobe
+    def create_wardrobe_items_limited(self, user_id: str, items: list[dict]) -> list:
+        self.latency["db_write"].sleep()
+        if len(self._wardrobe(user_id)) + len(items) > self.MAX_WARDROBE_ITEMS:
+            raise WardrobeLimitError()
+        created = [self._insert(user_id, item) for item in items]
+        self._item_counts[user_id] = len(self._wardrobe(user_id))
+        return created
+
+    def update_wardrobe_item(self, item_id: str, user_id: str, update_data: dict):
+        updated = self.update_wardrobe_items([item_id], user_id, update_data)
+        return updated[0] if updated else None
+
+    @_changes_wardrobe
+    def update_wardrobe_items(self, item_ids: list[str], user_id: str, update_data: dict) -> list:
+        self.latency["db_write"].sleep()
+        ids = set(item_ids)
+        updated = []
+        for item in self._wardrobe(user_id):
+            if item["id"] in ids:
+                item.update(update_data, version=self._bump(user_id))
+                updated.append(dict(item))
+        return updated
+
+    def delete_wardrobe_item(self, item_id: str, user_id: str):
+        deleted = self.delete_wardrobe_items([item_id], user_id)
+        return deleted or None
+
+    @_changes_wardrobe
+    def delete_wardrobe_items(self, item_ids: list[str], user_id: str) -> list:
+        self.latency["db_write"].sleep()
+        ids = set(item_ids)
+        wardrobe = self._wardrobe(user_id)
+        deleted = [dict(item) for item in wardrobe if item["id"] in ids]
+        wardrobe[:] = [item for item in wardrobe if item["id"] not in ids]
+        if deleted:
+            self._bump(user_id)
+        return deleted
+
+    # Usage accounting
+    def insert_usage_rows(self, rows: list[dict]):
+        self.latency["db_write"].sleep()
+
+    # Storage
+    def upload_image(self, file_path: str, file_data: bytes, content_type: str = "image/jpeg"):
+        self.latency["storage_upload"].sleep()
+        self.objects[file_path] = file_data
+        return f"https://fake.supabase.co/storage/v1/object/public/{self.storage_bucket}/{file_path}"
+
+    def download_image(self, file_path: str) -> bytes:
+        self.latency["storage_download"].sleep()
+        return self.objects.get(file_path, b"\xff\xd8\xff\xd9")
+
+    def remove_images(self, file_paths: list[str]):
+        self.latency["db_write"].sleep()
+        for path in file_paths:
+            self.objects.pop(path, None)
+
+    def list_storage_folders(self) -> list[str]:
+        return list(self.items)
+
+    def list_user_images(self, user_id: str) -> list[dict]:
+        return []
+
+class FakeOpenAIService(OpenAIService):
+    """OpenAIService whose model calls sleep and return canned, schema-valid answers."""
+
+    def __init__(self, latencies: dict, rng: random.Random):
+        # The client is created lazily and never touched here
+        super().__init__()
+        self.latency = {name: LatencyModel(*value, rng) for name, value in latencies.items()}
+        self.rng = rng
+
+    def scan_clothing_image(self, image_data: bytes, detail: Optional[str] = None,
+                            user_id: Optional[str] = None) -> dict:
+        # Encoding the payload is real work the service does before the call
+        self._image_data_url(image_data)
+        self.latency["vision"].sleep()
+        title, color = self.rng.choice(SAMPLE_TITLES)
+        return {
+            "title": title,
+            "description": f"A {title.lower()} with a regular fit.",
+            "color": color,
+            "warmth": self.rng.choice(WARMTHS),
+            "formality": self.rng.randint(1, 10),
+        }
+
+    def chat_with_stylist(self, user_message: str, chat_history: list, wardrobe_items: list,
+                          candidate_outfits: Optional[list] = None, user_id: Optional[str] = None,
+                          occasion: Optional[str] = None) -> str:
+        # Prompt assembly is real CPU work on the request path; keep it
+        messages = self._stylist_messages(user_message, chat_history, wardrobe_items, candidate_outfits, occasion)
+        self.latency["chat"].sleep()
+        picks = self.rng.sample(wardrobe_items, k=min(3, len(wardrobe_items)))
+        suggestion = ", ".join(f"**{item['title']}**" for item in picks)
+        return f"Try pairing {suggestion}. ({len(messages)} messages in context)"
+
+    def stream_chat_with_stylist(self, user_message: str, chat_history: list, wardrobe_items: list,
+                                 candidate_outfits: Optional[list] = None,
+                                 user_id: Optional[str] = None, occasion: Optional[str] = None) -> Iterator[str]:
+        reply = self.chat_with_stylist(user_message, chat_history, wardrobe_items, candidate_outfits, user_id, occasion)
+        # Roughly token-sized pieces; the latency is all paid before the first one, like time-to-first-token
+        for start in range(0, len(reply), 4):
+            yield reply[start:start + 4]
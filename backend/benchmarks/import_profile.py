@@ -0,0 +1,70 @@
+"""
+Import-time profile of the API (what a cold start pays before serving).
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter and
+summarizes the output: total import time, the slowest top-level packages
+and the app's own modules, by cumulative time.
+
+Usage (from backend/):
+    python -m benchmarks.import_profile                     # import app.main
+    python -m benchmarks.import_profile --module app.routers.scan --top 20
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+def profile(module: str) -> list[tuple[str, int, int, int]]:
+    """Return (module, self_us, cumulative_us, depth) for every module imported."""
+    env = {
+        **os.environ,
+        "SUPABASE_URL": os.getenv("SUPABASE_URL", "http://localhost.invalid"),
+        "SUPABASE_SERVICE_KEY": os.getenv("SUPABASE_SERVICE_KEY", "benchmark"),
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "benchmark"),
+    }
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env,
+    )
+    if result.returncode != 0:
+        raise SystemExit(result.stderr)
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return entries
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time profile of the API")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    entries = profile(args.module)
+    total = next(cumulative for name, _, cumulative, _ in entries if name == args.module)
+
+    # The first import of a package carries its whole cost; later ones are cache hits
+    packages: dict[str, int] = {}
+    for name, _, cumulative, _ in entries:
+        if "." not in name and not name.startswith("_") and name != "app":
+            packages.setdefault(name, cumulative)
+    app_modules = [(name, cumulative) for name, _, cumulative, _ in entries if name.startswith("app.")]
+
+    print(f"import {args.module}: {total / 1000:.1f} ms ({len(entries)} modules)\n")
+
+    print(f"{'package':<40}{'cumulative ms':>14}{'share':>8}")
+    for name, cumulative in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<40}{cumulative / 1000:>14.1f}{cumulative / total:>8.0%}")
+
+    print(f"\n{'app module':<40}{'cumulative ms':>14}{'share':>8}")
+    for name, cumulative in sorted(app_modules, key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<40}{cumulative / 1000:>14.1f}{cumulative / total:>8.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+Offline load benchmark for the API.
+
+Swaps supabase_service and openai_service for the in-process fakes in
+benchmarks/fakes.py, drives app.main:app over ASGI (no sockets, no network)
+with a request mix, and reports throughput, latency percentiles and CPU
+time per stage.
+
+Usage (from backend/):
+    python -m benchmarks.run                          # mixed workload, defaults
+    python -m benchmarks.run --mix scans --requests 50 --concurrency 4
+    python -m benchmarks.run --latency-scale 1.0      # real-world upstream latencies
+    python -m benchmarks.run --latency vision=800:2000 --images ~/photos
+    python -m benchmarks.run --json > before.json     # machine-readable, for diffing runs
+
+Upstream latencies default to 10% of realistic values (--latency-scale 0.1)
+so a run takes seconds; CPU figures do not depend on the scale.
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import functools
+import threading
+from pathlib import Path
+from collections import Counter, defaultdict
+
+# Dummy settings, so a real .env is never picked up (load_dotenv does not
+# override) and nothing can reach the network even if a fake misses a call.
+os.environ.setdefault("SUPABASE_URL", "http://localhost.invalid")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "benchmark")
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+# A few synthetic users send every request; per-user limits would turn the load into 429s
+os.environ.setdefault("RATE_LIMIT", "false")
+
+import httpx
+import numpy as np
+from PIL import Image, ImageDraw
+from app.main import app
+from app.services import openai_service as openai_module, supabase_service as supabase_module
+from app.services.image_service import image_service
+from app.services.outfit_service import outfit_service
+from app.services.outfit_index import outfit_index
+from app.services.chat_cache import chat_cache
+from benchmarks.fakes import DEFAULT_LATENCIES, FakeOpenAIService, FakeSupabaseService
+
+# Request weights per mix
+MIXES = {
+    "mixed": {"wardrobe_read": 70, "scan": 10, "chat": 15, "outfits": 5},
+    "reads": {"wardrobe_read": 1},
+    "scans": {"scan": 1},
+    "chats": {"chat": 1},
+}
+
+CHAT_PROMPTS = [
+    "What should I wear to a job interview?",
+    "Put together something casual for a weekend brunch.",
+    "It's cold and rainy today, what do you suggest?",
+    "I have a wedding next month, what works from my wardrobe?",
+    "Give me an outfit for a first date at a nice restaurant.",
+    "What goes well with my black leather jacket?",
+    "Something comfortable for a long flight?",
+    "I need a smart casual look for the office.",
+]
+
+class StageProfiler:
+    """
+    Accumulates thread CPU time per named stage. Only the outermost
+    instrumented call on a thread is counted, so nested stages (e.g. a fake
+    method calling another) are not double-counted.
+    """
+
+    def __init__(self):
+        self.cpu = defaultdict(float)
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def wrap(self, stage: str, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(self._local, "active", False):
+                return func(*args, **kwargs)
+            self._local.active = True
+            start = time.thread_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.thread_time() - start
+                self._local.active = False
+                with self._lock:
+                    self.cpu[stage] += elapsed
+                    self.calls[stage] += 1
+        return wrapper
+
+    def instrument(self, obj, prefix: str, names):
+        for name in names:
+            setattr(obj, name, self.wrap(f"{prefix}.{name}", getattr(obj, name)))
+
+    def reset(self):
+        with self._lock:
+            self.cpu.clear()
+            self.calls.clear()
+
+def install_fakes(supabase, openai):
+    """Point every app module that imported the real singletons at the fakes."""
+    replacements = {
+        id(supabase_module.supabase_service): supabase,
+        id(openai_module.openai_service): openai,
+    }
+    for name, module in list(sys.modules.items()):
+        if module is None or not (name == "app" or name.startswith("app.")):
+            continue
+        for attr, value in list(vars(module).items()):
+            if id(value) in replacements:
+                setattr(module, attr, replacements[id(value)])
+
+def instrument_stages(profiler: StageProfiler, supabase, openai):
+    # The fake overrides the private fetches behind these two; time the public entry points
+    profiler.instrument(supabase, "supabase", ["get_user", "get_wardrobe_items"] + [
+        name for name in vars(FakeSupabaseService) if not name.startswith("_")
+    ])
+    profiler.instrument(openai, "openai", ["scan_clothing_image", "chat_with_stylist"])
+    profiler.instrument(image_service, "image", [
+        "validate_image", "compress_image", "compress_for_vision",
+        "compress_image_variants", "extract_dominant_color",
+    ])
+    profiler.instrument(outfit_service, "outfit", ["recommend"])
+    profiler.instrument(outfit_index, "outfit_index", ["candidates"])
+    profiler.instrument(chat_cache, "chat_cache", ["wardrobe_version", "get", "put"])
+
+def synthetic_photo(rng: random.Random, width: int = 3024, height: int = 4032) -> bytes:
+    """A phone-camera-sized JPEG: a garment shape on a textured background."""
+    background = tuple(rng.randint(170, 235) for _ in range(3))
+    garment = tuple(rng.randint(0, 255) for _ in range(3))
+    image = Image.new("RGB", (width, height), background)
+    draw = ImageDraw.Draw(image)
+    w, h = width, height
+    # Rough t-shirt silhouette
+    draw.polygon([
+        (0.30 * w, 0.20 * h), (0.70 * w, 0.20 * h), (0.92 * w, 0.35 * h), (0.82 * w, 0.45 * h),
+        (0.72 * w, 0.40 * h), (0.72 * w, 0.85 * h), (0.28 * w, 0.85 * h), (0.28 * w, 0.40 * h),
+        (0.18 * w, 0.45 * h), (0.08 * w, 0.35 * h),
+    ], fill=garment)
+    # Sensor noise, so the JPEG is as large and as hard to compress as a real photo
+    pixels = np.asarray(image, dtype=np.int16)
+    noise = np.random.default_rng(rng.getrandbits(32)).integers(-12, 13, size=pixels.shape, dtype=np.int16)
+    image = Image.fromarray(np.clip(pixels + noise, 0, 255).astype(np.uint8))
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+def load_images(directory: str | None, rng: random.Random) -> list[tuple[str, bytes]]:
+    if directory:
+        paths = sorted(p for p in Path(directory).expanduser().iterdir()
+                       if p.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp"))
+        if not paths:
+            raise SystemExit(f"No images found in {directory}")
+        return [(p.name, p.read_bytes()) for p in paths]
+    return [(f"synthetic-{i}.jpg", synthetic_photo(rng)) for i in range(4)]
+
+def build_request(kind: str, rng: random.Random, users: list[str], images: list) -> dict:
+    user_id = rng.choice(users)
+    headers = {"Authorization": f"Bearer token-{user_id}"}
+    if kind == "wardrobe_read":
+        return {"method": "GET", "url": "/wardrobe/", "headers": headers}
+    if kind == "outfits":
+        return {"method": "GET", "url": "/wardrobe/outfits", "headers": headers}
+    if kind == "scan":
+        name, data = rng.choice(images)
+        return {"method": "POST", "url": "/scan/", "headers": headers,
+                "files": {"file": (name, data, "image/jpeg")}}
+    if kind == "chat":
+        history = []
+        for _ in range(rng.randint(0, 3)):
+            history += [{"role": "user", "content": rng.choice(CHAT_PROMPTS)},
+                        {"role": "assistant", "content": "Try your navy blazer with the khaki chinos."}]
+        return {"method": "POST", "url": "/chat/", "headers": headers,
+                "json": {"message": rng.choice(CHAT_PROMPTS), "history": history}}
+    raise ValueError(kind)
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+async def drive(plan: list[tuple[str, dict]], concurrency: int) -> tuple[list[tuple[str, int, float]], float]:
+    """Send the planned requests with a fixed number of concurrent clients."""
+    results = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for entry in plan:
+        queue.put_nowait(entry)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        async def worker():
+            while not queue.empty():
+                kind, request = queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.request(**request)
+                await response.aread()
+                results.append((kind, response.status_code, time.perf_counter() - start))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+
+    return results, wall
+
+def summarize(results, wall: float, cpu: float, profiler: StageProfiler) -> dict:
+    by_kind = defaultdict(list)
+    for kind, status, latency in results:
+        by_kind[kind].append((status, latency))
+
+    def stats(entries):
+        latencies = sorted(latency for _, latency in entries)
+        return {
+            "requests": len(entries),
+            "errors": sum(1 for status, _ in entries if status >= 400),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+            "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        }
+
+    staged = sum(profiler.cpu.values())
+    stages = {
+        stage: {"calls": profiler.calls[stage], "cpu_ms": round(seconds * 1000, 1),
+                "cpu_ms_per_call": round(seconds * 1000 / profiler.calls[stage], 2)}
+        for stage, seconds in sorted(profiler.cpu.items(), key=lambda item: -item[1])
+    }
+    # Everything not inside an instrumented stage: routing, validation, serialization, middleware
+    stages["other"] = {"calls": len(results), "cpu_ms": round(max(0.0, cpu - staged) * 1000, 1),
+                       "cpu_ms_per_call": round(max(0.0, cpu - staged) * 1000 / max(1, len(results)), 2)}
+
+    return {
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(results) / wall, 2) if wall else 0.0,
+        "cpu_s": round(cpu, 3),
+        "total": stats([(status, latency) for _, status, latency in results]),
+        "by_kind": {kind: stats(entries) for kind, entries in sorted(by_kind.items())},
+        "stages": stages,
+    }
+
+def print_report(report: dict, args):
+    print(f"mix={args.mix} requests={args.requests} concurrency={args.concurrency} "
+          f"users={args.users} latency_scale={args.latency_scale}")
+    print(f"wall {report['wall_s']}s  throughput {report['throughput_rps']} req/s  cpu {report['cpu_s']}s\n")
+
+    print(f"{'request':<16}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for kind, row in [*report["by_kind"].items(), ("total", report["total"])]:
+        print(f"{kind:<16}{row['requests']:>8}{row['errors']:>8}{row['p50_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}")
+
+    print(f"\n{'stage':<36}{'calls':>8}{'cpu ms':>12}{'ms/call':>10}")
+    for stage, row in report["stages"].items():
+        print(f"{stage:<36}{row['calls']:>8}{row['cpu_ms']:>12}{row['cpu_ms_per_call']:>10}")
+
+def parse_latency(value: str) -> tuple[str, tuple[float, float]]:
+    try:
+        name, spec = value.split("=", 1)
+        median, p99 = (float(part) for part in spec.split(":", 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected NAME=MEDIAN_MS:P99_MS")
+    if name not in DEFAULT_LATENCIES:
+        raise argparse.ArgumentTypeError(f"unknown upstream {name!r}; one of {', '.join(DEFAULT_LATENCIES)}")
+    return name, (median, p99)
+
+async def main(args):
+    rng = random.Random(args.seed)
+    latencies = {name: (median * args.latency_scale, p99 * args.latency_scale)
+                 for name, (median, p99) in DEFAULT_LATENCIES.items()}
+    latencies.update(dict(args.latency))
+
+    supabase = FakeSupabaseService(latencies, random.Random(args.seed), wardrobe_size=args.wardrobe_size)
+    openai = FakeOpenAIService(latencies, random.Random(args.seed))
+    install_fakes(supabase, openai)
+    profiler = StageProfiler()
+    instrument_stages(profiler, supabase, openai)
+
+    images = load_images(args.images, rng) if "scan" in MIXES[args.mix] else []
+    users = [f"00000000-0000-4000-8000-{i:012d}" for i in range(args.users)]
+    kinds, weights = zip(*MIXES[args.mix].items())
+
+    def make_plan(count):
+        return [(kind, build_request(kind, rng, users, images))
+                for kind in rng.choices(kinds, weights=weights, k=count)]
+
+    await app.router.startup()
+    try:
+        # Warm-up: seeds each user's wardrobe and gets lazy imports out of the way
+        await drive(make_plan(max(args.warmup, len(users))), args.concurrency)
+        profiler.reset()
+
+        plan = make_plan(args.requests)
+        cpu_start = time.process_time()
+        results, wall = await drive(plan, args.concurrency)
+        cpu = time.process_time() - cpu_start
+    finally:
+        await app.router.shutdown()
+
+    report = summarize(results, wall, cpu, profiler)
+    if args.json:
+        print(json.dumps({"config": {k: v for k, v in vars(args).items() if k != "latency"}, **report}, indent=2))
+    else:
+        print_report(report, args)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline API benchmark with fake Supabase and OpenAI backends")
+    parser.add_argument("--mix", choices=MIXES, default="mixed")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--wardrobe-size", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--latency-scale", type=float, default=0.1,
+                        help="multiplier for the default upstream latencies (1.0 = realistic)")
+    parser.add_argument("--latency", type=parse_latency, action="append", default=[],
+                        help="override one upstream, e.g. vision=800:2000 (median and p99 in ms, unscaled)")
+    parser.add_argument("--images", help="directory of sample photos for scans (default: synthetic)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    asyncio.run(main(parser.parse_args()))
@@ -20,9 +20,13 @@ CREATE TABLE IF NOT EXISTS wardrobe_items (
     formality INTEGER NOT NULL CHECK (formality >= 1 AND formality <= 10),
     image_url TEXT NOT NULL,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc', NOW()),
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc', NOW())
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc', NOW()),
+    version BIGINT NOT NULL DEFAULT 0
 );
 
+-- For databases created before the version column existed
+ALTER TABLE wardrobe_items ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
+
 -- Create index on user_id for faster queries
 CREATE INDEX IF NOT EXISTS idx_wardrobe_items_user_id ON wardrobe_items(user_id);
 
@@ -43,8 +47,255 @@ CREATE TRIGGER update_wardrobe_items_updated_at
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_column();
 
+-- Per-user wardrobe version, bumped on every insert/update/delete.
+-- The API uses it as the ETag for GET /wardrobe. Each row records the version
+-- of its last change and deletes leave a tombstone, so clients can sync with
+-- GET /wardrobe/changes?since=<version>.
+CREATE TABLE IF NOT EXISTS wardrobe_versions (
+    user_id UUID PRIMARY KEY REFERENCES auth.users(id) ON DELETE CASCADE,
+    version BIGINT NOT NULL DEFAULT 0,
+    tombstones_pruned_through BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS wardrobe_tombstones (
+    item_id UUID NOT NULL,
+    user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    version BIGINT NOT NULL,
+    deleted_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc', NOW())
+);
+
+CREATE INDEX IF NOT EXISTS idx_wardrobe_items_user_version ON wardrobe_items(user_id, version);
+CREATE INDEX IF NOT EXISTS idx_wardrobe_tombstones_user_version ON wardrobe_tombstones(user_id, version);
+
+-- Runs alongside update_updated_at_column. The upsert holds the user's
+-- wardrobe_versions row lock until commit, so versions commit in order.
+CREATE OR REPLACE FUNCTION bump_wardrobe_version()
+RETURNS TRIGGER AS $$
+DECLARE
+    owner UUID;
+    new_version BIGINT;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        owner := OLD.user_id;
+    ELSE
+        owner := NEW.user_id;
+    END IF;
+
+    INSERT INTO wardrobe_versions (user_id, version) VALUES (owner, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = wardrobe_versions.version + 1
+    RETURNING version INTO new_version;
+
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO wardrobe_tombstones (item_id, user_id, version) VALUES (OLD.id, owner, new_version);
+        RETURN NULL;
+    END IF;
+
+    NEW.version := new_version;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS bump_wardrobe_items_version ON wardrobe_items;
+
+CREATE TRIGGER bump_wardrobe_items_version
+    BEFORE INSERT OR UPDATE ON wardrobe_items
+    FOR EACH ROW
+    EXECUTE FUNCTION bump_wardrobe_version();
+
+CREATE TRIGGER record_wardrobe_items_delete
+    AFTER DELETE ON wardrobe_items
+    FOR EACH ROW
+    EXECUTE FUNCTION bump_wardrobe_version();
+
+-- Changes since a version in one call. If tombstones the client needs have
+-- been pruned, returns the full wardrobe with reset = true.
+CREATE OR REPLACE FUNCTION get_wardrobe_changes(p_user_id UUID, p_since BIGINT)
+RETURNS JSON AS $$
+DECLARE
+    current_version BIGINT;
+    pruned_through BIGINT;
+BEGIN
+    SELECT version, tombstones_pruned_through INTO current_version, pruned_through
+    FROM wardrobe_versions WHERE user_id = p_user_id;
+
+    current_version := COALESCE(current_version, 0);
+    pruned_through := COALESCE(pruned_through, 0);
+
+    IF p_since < pruned_through THEN
+        RETURN json_build_object(
+            'version', current_version,
+            'reset', true,
+            'upserted', COALESCE((SELECT json_agg(w ORDER BY w.created_at DESC) FROM wardrobe_items w
+                                  WHERE w.user_id = p_user_id), '[]'::json),
+            'deleted', '[]'::json
+        );
+    END IF;
+
+    RETURN json_build_object(
+        'version', current_version,
+        'reset', false,
+        'upserted', COALESCE((SELECT json_agg(w ORDER BY w.version) FROM wardrobe_items w
+                              WHERE w.user_id = p_user_id AND w.version > p_since), '[]'::json),
+        'deleted', COALESCE((SELECT json_agg(t.item_id) FROM wardrobe_tombstones t
+                             WHERE t.user_id = p_user_id AND t.version > p_since), '[]'::json)
+    );
+END;
+$$ language 'plpgsql';
+
+-- Drop old tombstones (schedule with pg_cron, e.g. daily)
+CREATE OR REPLACE FUNCTION prune_wardrobe_tombstones(p_older_than INTERVAL DEFAULT '30 days')
+RETURNS VOID AS $$
+BEGIN
+    WITH pruned AS (
+        DELETE FROM wardrobe_tombstones
+        WHERE deleted_at < TIMEZONE('utc', NOW()) - p_older_than
+        RETURNING user_id, version
+    )
+    UPDATE wardrobe_versions v
+    SET tombstones_pruned_through = GREATEST(v.tombstones_pruned_through, p.max_version)
+    FROM (SELECT user_id, MAX(version) AS max_version FROM pruned GROUP BY user_id) p
+    WHERE v.user_id = p.user_id;
+END;
+$$ language 'plpgsql';
+
+-- Keyset pagination index for GET /wardrobe
+CREATE INDEX IF NOT EXISTS idx_wardrobe_items_user_created_id ON wardrobe_items(user_id, created_at DESC, id DESC);
+
+-- Create-and-count: enforces the per-user item limit and inserts in one call.
+-- The advisory lock serializes creates per user so concurrent uploads cannot
+-- both pass the limit check.
+CREATE OR REPLACE FUNCTION create_wardrobe_item_limited(
+    p_user_id UUID,
+    p_title VARCHAR,
+    p_description VARCHAR,
+    p_color VARCHAR,
+    p_warmth VARCHAR,
+    p_formality INTEGER,
+    p_image_url TEXT,
+    p_max_items INTEGER DEFAULT 100
+)
+RETURNS JSON AS $$
+DECLARE
+    current_count INTEGER;
+    new_item wardrobe_items;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext(p_user_id::text));
+
+    SELECT COUNT(*) INTO current_count FROM wardrobe_items WHERE user_id = p_user_id;
+
+    IF current_count >= p_max_items THEN
+        RAISE EXCEPTION 'WARDROBE_LIMIT_REACHED';
+    END IF;
+
+    INSERT INTO wardrobe_items (user_id, title, description, color, warmth, formality, image_url)
+    VALUES (p_user_id, p_title, p_description, p_color, p_warmth, p_formality, p_image_url)
+    RETURNING * INTO new_item;
+
+    RETURN json_build_object('item', row_to_json(new_item), 'item_count', current_count + 1);
+END;
+$$ language 'plpgsql';
+
+-- Bulk variant: inserts a JSON array of items in one statement, all or nothing.
+CREATE OR REPLACE FUNCTION create_wardrobe_items_limited(
+    p_user_id UUID,
+    p_items JSON,
+    p_max_items INTEGER DEFAULT 100
+)
+RETURNS JSON AS $$
+DECLARE
+    current_count INTEGER;
+    new_count INTEGER;
+    created JSON;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext(p_user_id::text));
+
+    SELECT COUNT(*) INTO current_count FROM wardrobe_items WHERE user_id = p_user_id;
+    new_count := json_array_length(p_items);
+
+    IF current_count + new_count > p_max_items THEN
+        RAISE EXCEPTION 'WARDROBE_LIMIT_REACHED';
+    END IF;
+
+    WITH inserted AS (
+        INSERT INTO wardrobe_items (user_id, title, description, color, warmth, formality, image_url)
+        SELECT p_user_id, i.title, i.description, i.color, i.warmth, i.formality, i.image_url
+        FROM json_to_recordset(p_items) AS i(
+            title VARCHAR, description VARCHAR, color VARCHAR,
+            warmth VARCHAR, formality INTEGER, image_url TEXT
+        )
+        RETURNING *
+    )
+    SELECT COALESCE(json_agg(row_to_json(inserted)), '[]'::json) INTO created FROM inserted;
+
+    RETURN json_build_object('items', created, 'item_count', current_count + new_count);
+END;
+$$ language 'plpgsql';
+
+-- OpenAI token usage, flushed periodically by the API (one row per user/endpoint/model per period)
+CREATE TABLE IF NOT EXISTS openai_usage (
+    id BIGSERIAL PRIMARY KEY,
+    user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE,
+    endpoint VARCHAR(50) NOT NULL,
+    model VARCHAR(50) NOT NULL,
+    period_start TIMESTAMP WITH TIME ZONE NOT NULL,
+    period_end TIMESTAMP WITH TIME ZONE NOT NULL,
+    calls INTEGER NOT NULL,
+    prompt_tokens BIGINT NOT NULL,
+    completion_tokens BIGINT NOT NULL,
+    image_tokens BIGINT NOT NULL,
+    total_latency_ms BIGINT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_openai_usage_user_period ON openai_usage(user_id, period_start DESC);
+
+-- Per-user token buckets, used when the API runs with RATE_LIMIT_BACKEND=supabase
+CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+    key TEXT PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+-- Refill a bucket for the time since its last use and take p_cost tokens if
+-- there are enough. The row lock makes concurrent takes for a key sequential.
+CREATE OR REPLACE FUNCTION take_rate_limit_tokens(
+    p_key TEXT,
+    p_cost DOUBLE PRECISION,
+    p_capacity DOUBLE PRECISION,
+    p_refill_per_second DOUBLE PRECISION
+)
+RETURNS JSON AS $$
+DECLARE
+    now_ts TIMESTAMP WITH TIME ZONE := clock_timestamp();
+    current_tokens DOUBLE PRECISION;
+    allowed BOOLEAN;
+BEGIN
+    INSERT INTO rate_limit_buckets (key, tokens, updated_at)
+    VALUES (p_key, p_capacity, now_ts)
+    ON CONFLICT (key) DO NOTHING;
+
+    SELECT LEAST(p_capacity, b.tokens + EXTRACT(EPOCH FROM (now_ts - b.updated_at)) * p_refill_per_second)
+    INTO current_tokens
+    FROM rate_limit_buckets b WHERE b.key = p_key
+    FOR UPDATE;
+
+    allowed := current_tokens >= p_cost;
+    IF allowed THEN
+        current_tokens := current_tokens - p_cost;
+    END IF;
+
+    UPDATE rate_limit_buckets SET tokens = current_tokens, updated_at = now_ts WHERE key = p_key;
+
+    RETURN json_build_object('allowed', allowed, 'tokens', current_tokens);
+END;
+$$ language 'plpgsql';
+
 -- Enable Row Level Security
 ALTER TABLE wardrobe_items ENABLE ROW LEVEL SECURITY;
+ALTER TABLE wardrobe_versions ENABLE ROW LEVEL SECURITY;
+ALTER TABLE wardrobe_tombstones ENABLE ROW LEVEL SECURITY;
+-- No policies: usage and rate limit buckets are only read and written with the service key
+ALTER TABLE openai_usage ENABLE ROW LEVEL SECURITY;
+ALTER TABLE rate_limit_buckets ENABLE ROW LEVEL SECURITY;
 
 -- Create RLS policies
 -- Users can only read their own wardrobe items
@@ -68,6 +319,16 @@ CREATE POLICY "Users can delete their own wardrobe items"
     ON wardrobe_items FOR DELETE
     USING (auth.uid() = user_id);
 
+-- Users can only read their own wardrobe version
+CREATE POLICY "Users can view their own wardrobe version"
+    ON wardrobe_versions FOR SELECT
+    USING (auth.uid() = user_id);
+
+-- Users can only read their own tombstones
+CREATE POLICY "Users can view their own wardrobe tombstones"
+    ON wardrobe_tombstones FOR SELECT
+    USING (auth.uid() = user_id);
+
 -- Storage Setup Instructions:
 -- 1. Go to Supabase Dashboard -> Storage
 -- 2. Create a new bucket called "wardrobe-images"
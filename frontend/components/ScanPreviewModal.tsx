@@ -9,6 +9,7 @@ interface ScanResult {
   color: string;
   warmth: string;
   formality: number;
+  scan_token?: string;
 }
 
 interface ScanPreviewModalProps {
@@ -84,6 +84,28 @@ export const scanAPI = {
 
     return response.json();
   },
+
+  // Fast local color estimate, used to prefill the preview while scanImage runs
+  previewColor: async (file: File) => {
+    const token = getAccessToken();
+    const formData = new FormData();
+    formData.append('file', file);
+
+    const response = await fetch(`${API_BASE_URL}/scan/color`, {
+      method: 'POST',
+      headers: {
+        Authorization: `Bearer ${token}`,
+      },
+      body: formData,
+    });
+
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({ detail: 'Color preview failed' }));
+      throw new Error(error.detail || 'Color preview failed');
+    }
+
+    return response.json();
+  },
 };
 
 // Wardrobe API
@@ -104,6 +126,25 @@ export const wardrobeAPI = {
     return fetchAPI(`/wardrobe/${queryString ? `?${queryString}` : ''}`);
   },
 
+  // Incremental sync: pass the version returned by the previous call
+  getChanges: (since: number) => fetchAPI(`/wardrobe/changes?since=${since}`),
+
+  getOutfits: (options?: {
+    warmth?: string;
+    formality_min?: number;
+    formality_max?: number;
+    limit?: number;
+  }) => {
+    const params = new URLSearchParams();
+    if (options?.warmth) params.append('warmth', options.warmth);
+    if (options?.formality_min) params.append('formality_min', options.formality_min.toString());
+    if (options?.formality_max) params.append('formality_max', options.formality_max.toString());
+    if (options?.limit) params.append('limit', options.limit.toString());
+
+    const queryString = params.toString();
+    return fetchAPI(`/wardrobe/outfits${queryString ? `?${queryString}` : ''}`);
+  },
+
   createItem: async (itemData: {
     title: string;
     description: string;
@@ -111,23 +152,36 @@ export const wardrobeAPI = {
     warmth: string;
     formality: number;
     file: File;
+    scan_token?: string;
   }) => {
     const token = getAccessToken();
-    const formData = new FormData();
-    formData.append('title', itemData.title);
-    formData.append('description', itemData.description);
-    formData.append('color', itemData.color);
-    formData.append('warmth', itemData.warmth);
-    formData.append('formality', itemData.formality.toString());
-    formData.append('file', itemData.file);
-
-    const response = await fetch(`${API_BASE_URL}/wardrobe/`, {
-      method: 'POST',
-      headers: {
-        Authorization: `Bearer ${token}`,
-      },
-      body: formData,
-    });
+    const send = (useScanToken: boolean) => {
+      const formData = new FormData();
+      formData.append('title', itemData.title);
+      formData.append('description', itemData.description);
+      formData.append('color', itemData.color);
+      formData.append('warmth', itemData.warmth);
+      formData.append('formality', itemData.formality.toString());
+      // The image was already uploaded during the scan; only send it if the token has expired
+      if (useScanToken) {
+        formData.append('scan_token', itemData.scan_token as string);
+      } else {
+        formData.append('file', itemData.file);
+      }
+
+      return fetch(`${API_BASE_URL}/wardrobe/`, {
+        method: 'POST',
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+        body: formData,
+      });
+    };
+
+    let response = await send(Boolean(itemData.scan_token));
+    if (response.status === 410) {
+      response = await send(false);
+    }
 
     if (!response.ok) {
       let errorMessage = 'Failed to create item';
@@ -160,6 +214,24 @@ export const wardrobeAPI = {
     fetchAPI(`/wardrobe/${itemId}`, {
       method: 'DELETE',
     }),
+
+  bulkUpdateItems: (itemIds: string[], update: {
+    title?: string;
+    description?: string;
+    color?: string;
+    warmth?: string;
+    formality?: number;
+  }) =>
+    fetchAPI('/wardrobe/bulk/update', {
+      method: 'POST',
+      body: JSON.stringify({ item_ids: itemIds, update }),
+    }),
+
+  bulkDeleteItems: (itemIds: string[]) =>
+    fetchAPI('/wardrobe/bulk/delete', {
+      method: 'POST',
+      body: JSON.stringify({ item_ids: itemIds }),
+    }),
 };
 
 // Chat API